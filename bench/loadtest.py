@@ -0,0 +1,238 @@
+"""Load test of the API through the WSGI app.
+
+Seeds a database with synthetic drivers and jobs, then drives the real routes with a
+pool of threads, each using its own Flask test client. Pusher and mail are stubbed by
+the ``Benchmark`` config. Results are written as JSON so runs can be compared:
+
+    python -m bench.loadtest --drivers 10000 --jobs 1000000 --concurrency 8 --output run.json
+
+Set ``BENCH_DATABASE_URL`` to run against Postgres instead of the default SQLite file.
+"""
+import os
+
+os.environ['env'] = 'src.config.Benchmark'
+
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import gc
+import json
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from src.main import app, db, bcrypt
+from src.models import User, Job
+from src import loader, metrics
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench'
+
+
+def seed(drivers, jobs):
+    """Recreate the schema and load ``drivers`` users and ``jobs`` jobs with the bulk loader."""
+    db.drop_all()
+    db.create_all()
+    password_hash = bcrypt.generate_password_hash(BENCH_PASSWORD)
+    bench_user = {'username': BENCH_USERNAME, 'email': 'bench@example.com', 'confirmed': True}
+    loader.load(User, loader.imported_users([bench_user], password_hash))
+    loader.load(User, loader.synthetic_users(drivers, password_hash))
+    loader.load(Job, loader.synthetic_jobs(jobs, loader.confirmed_user_ids()))
+
+
+def basic_auth():
+    credentials = b64encode(f'{BENCH_USERNAME}:{BENCH_PASSWORD}'.encode('utf-8')).decode('ascii')
+    return {'Authorization': f'Basic {credentials}'}
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Scenario:
+    def __init__(self, name, method, rule, path, headers, body=None):
+        self.name = name
+        self.method = method
+        self.rule = rule
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+def scenarios(job_ids, driver_ids, created, headers):
+    token, basic = headers
+    new_job = lambda: {'name': 'Bench', 'contact_number': '01223 000000', 'number_of_people': 2,
+                       'pickup_time': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                       'pickup_address': {'house': '1', 'road': 'Mill Road', 'village': 'Cambridge', 'postcode': 'CB1 2AB'},
+                       'dropoff_address': {'house': '2', 'road': 'Hills Road', 'village': 'Cambridge', 'postcode': 'CB2 1CD'}}
+    return [
+        Scenario('login', 'GET', '/login', lambda: '/login', lambda: basic),
+        Scenario('list_jobs_token', 'GET', '/job', lambda: '/job?limit=100', lambda: token),
+        Scenario('list_jobs_basic', 'GET', '/job', lambda: '/job?limit=100', lambda: basic),
+        Scenario('list_open_jobs', 'GET', '/job', lambda: '/job?is_complete=false&limit=100', lambda: token),
+        Scenario('get_job', 'GET', '/job/<id>', lambda: f'/job/{random.choice(job_ids)}', lambda: token),
+        Scenario('user_jobs', 'GET', '/user/<id>/jobs', lambda: f'/user/{random.choice(driver_ids)}/jobs', lambda: token),
+        Scenario('create_job', 'POST', '/job', lambda: '/job', lambda: token, new_job),
+        Scenario('update_job', 'PUT', '/job/<id>', lambda: f'/job/{random.choice(job_ids)}', lambda: token,
+                 lambda: {'price': random.randint(500, 5000)}),
+        Scenario('delete_job', 'DELETE', '/job/<id>', lambda: f'/job/{created.pop()}', lambda: token),
+    ]
+
+
+def query_totals(scenario):
+    counts = metrics.request_queries.values.get((scenario.method, scenario.rule))
+    return (counts[-2], counts[-1]) if counts else (0, 0)
+
+
+def rss_mb():
+    """The current resident set size of this process in MB, or None without ``/proc``."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize() / 2 ** 20
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS while a scenario runs, to report how far it rose above the start."""
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_mb = self.peak_mb = rss_mb()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        current = rss_mb()
+        if current is not None and current > self.peak_mb:
+            self.peak_mb = current
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        self.sample()
+        if self.start_mb is None:
+            return {'rss_start_mb': None, 'rss_growth_mb': None, 'rss_end_mb': None}
+        return {'rss_start_mb': round(self.start_mb, 1), 'rss_growth_mb': round(self.peak_mb - self.start_mb, 1),
+                'rss_end_mb': round(rss_mb(), 1)}
+
+
+def run(scenario, requests, concurrency, created):
+    latencies, errors = [], []
+    local = threading.local()
+    queries_before, count_before = query_totals(scenario)
+
+    def call(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        body = scenario.body() if scenario.body else None
+        start = time.perf_counter()
+        response = client.open(scenario.path(), method=scenario.method, headers=scenario.headers(), json=body)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+        elif scenario.name == 'create_job':
+            created.append(response.get_json()['public_id'])
+        latencies.append(elapsed)
+
+    gc.collect()
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    wall = time.perf_counter() - start
+    memory = sampler.stop()
+
+    queries_after, count_after = query_totals(scenario)
+    ordered = sorted(latencies)
+    return dict({
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'latency_ms': {name: round(value * 1000, 2) if value is not None else None for name, value in (
+            ('p50', percentile(ordered, 0.50)),
+            ('p95', percentile(ordered, 0.95)),
+            ('p99', percentile(ordered, 0.99)),
+            ('mean', sum(ordered) / len(ordered) if ordered else None),
+            ('max', ordered[-1] if ordered else None),
+        )},
+        'queries_per_request': round((queries_after - queries_before) / (count_after - count_before), 2)
+                               if count_after > count_before else None,
+    }, **memory)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--only', nargs='*', help='names of the scenarios to run')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed(args.drivers, args.jobs)
+            print(f'Seeded {args.drivers} drivers and {args.jobs} jobs in {time.perf_counter() - started:.1f}s',
+                  file=sys.stderr)
+        job_ids = [row[0] for row in db.session.query(Job.public_id).order_by(db.func.random()).limit(1000)]
+        driver_ids = [row[0] for row in db.session.query(User.public_id).filter(User.username != BENCH_USERNAME)
+                      .order_by(db.func.random()).limit(1000)]
+        db.session.remove()
+
+    client = app.test_client()
+    token = client.get('/login', headers=basic_auth()).get_json()['token']
+    headers = ({'x-access-token': token}, basic_auth())
+
+    created = []
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'database': db.engine.url.drivername,
+            'drivers': args.drivers,
+            'jobs': args.jobs,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'started_at': datetime.utcnow().isoformat(),
+        },
+        'endpoints': {},
+    }
+    for scenario in scenarios(job_ids, driver_ids, created, headers):
+        if args.only and scenario.name not in args.only:
+            continue
+        requests = min(args.requests, len(created)) if scenario.name == 'delete_job' else args.requests
+        report['endpoints'][scenario.name] = run(scenario, requests, args.concurrency, created)
+        print(f'{scenario.name}: {report["endpoints"][scenario.name]}', file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
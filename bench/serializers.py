@@ -0,0 +1,56 @@
+"""Micro-benchmark of the compiled job serializer against marshmallow.
+
+Builds transient jobs in memory, checks that both paths produce identical dicts and
+identical JSON, and prints the time each takes.
+
+    python -m bench.serializers [number_of_jobs]
+"""
+from datetime import datetime, timedelta
+import sys
+import timeit
+
+from flask import jsonify
+
+from src.main import app
+from src.models import User, Job, JobSchema
+from src.serializers import dump_job, dumps
+
+
+def make_jobs(count):
+    drivers = [User(username=f'driver{i}', email=f'driver{i}@example.com', last_active=datetime(2019, 10, 1))
+               for i in range(10)]
+    start = datetime(2019, 10, 23, 17, 58, 27, 825593)
+    address = {'house': '1', 'road': 'Mill Road', 'village': 'Cambridge', 'postcode': 'CB1 2AB'}
+    jobs = []
+    for i in range(count):
+        job = Job(public_id=f'job-{i}', number_of_people=i % 4 + 1, name=f'Customer {i}',
+                  contact_number='01223 000000', time_allowed=30, price=1000 + i, is_complete=bool(i % 2),
+                  pickup_address=address, dropoff_address=address)
+        job._pickup_time = start + timedelta(minutes=i)
+        job.driver = drivers[i % len(drivers)] if i % 3 else None
+        jobs.append(job)
+    return jobs
+
+
+def main(count):
+    jobs = make_jobs(count)
+    schema = JobSchema(many=True)
+    with app.test_request_context():
+        expected = schema.dump(jobs)
+        actual = [dump_job(job) for job in jobs]
+        assert actual == expected, 'compiled serializer output differs from marshmallow'
+        assert dumps(actual) == jsonify(expected).get_data(as_text=True), 'encoded output differs from jsonify'
+
+        marshmallow_time = min(timeit.repeat(lambda: schema.dump(jobs), number=1, repeat=5))
+        compiled_time = min(timeit.repeat(lambda: [dump_job(job) for job in jobs], number=1, repeat=5))
+        jsonify_time = min(timeit.repeat(lambda: jsonify(expected), number=1, repeat=5))
+        dumps_time = min(timeit.repeat(lambda: dumps(actual), number=1, repeat=5))
+    print(f'{count} jobs')
+    print(f'marshmallow: {marshmallow_time * 1000:.1f} ms')
+    print(f'compiled:    {compiled_time * 1000:.1f} ms ({marshmallow_time / compiled_time:.1f}x)')
+    print(f'jsonify:     {jsonify_time * 1000:.1f} ms')
+    print(f'dumps:       {dumps_time * 1000:.1f} ms ({jsonify_time / dumps_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,152 @@
+"""Compare gunicorn's sync and gevent workers under concurrent HTTP load.
+
+Seeds the benchmark database once, then for each worker class starts gunicorn with the
+same number of worker processes and drives read endpoints over HTTP with many clients
+at once. The sync worker serves one request per process at a time; the gevent worker
+(the Procfile default) keeps every in-flight request in a greenlet, so the gap grows
+with the time requests spend waiting on the database. Use Postgres for a fair picture:
+
+    BENCH_DATABASE_URL=postgresql://localhost/cbtaxis_bench python -m bench.workers --concurrency 200
+"""
+import os
+
+os.environ['env'] = 'src.config.Benchmark'
+
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from bench.loadtest import seed, percentile, git_revision, BENCH_USERNAME, BENCH_PASSWORD
+from src.main import app, db
+from src.models import User, Job
+
+WORKER_ARGS = {
+    'sync': ['--worker-class', 'sync'],
+    'gevent': ['--worker-class', 'gevent', '--worker-connections', '2000'],
+}
+
+
+def fetch(url, headers):
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def start_server(worker_class, workers, port):
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py',
+               '--workers', str(workers), '--bind', f'127.0.0.1:{port}'] + WORKER_ARGS[worker_class]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            fetch(f'http://127.0.0.1:{port}/metrics', {})
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'gunicorn with {worker_class} workers did not start')
+
+
+def run(base_url, path, headers, requests, concurrency):
+    latencies, errors = [], []
+
+    def call(_):
+        start = time.perf_counter()
+        try:
+            status = fetch(base_url + path(), headers)
+        except OSError:
+            status = None
+        latencies.append(time.perf_counter() - start)
+        if status is None or status >= 400:
+            errors.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    wall = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'latency_ms': {name: round(percentile(ordered, fraction) * 1000, 2) if ordered else None
+                       for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if not args.no_seed:
+            seed(args.drivers, args.jobs)
+        job_ids = [row[0] for row in db.session.query(Job.public_id).order_by(db.func.random()).limit(1000)]
+        driver_ids = [row[0] for row in db.session.query(User.public_id).filter(User.username != BENCH_USERNAME)
+                      .order_by(db.func.random()).limit(1000)]
+        db.session.remove()
+
+    endpoints = {
+        'list_jobs': lambda: '/job?limit=100',
+        'get_job': lambda: f'/job/{random.choice(job_ids)}',
+        'user_jobs': lambda: f'/user/{random.choice(driver_ids)}/jobs',
+    }
+    credentials = b64encode(f'{BENCH_USERNAME}:{BENCH_PASSWORD}'.encode('utf-8')).decode('ascii')
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'database': db.engine.url.drivername,
+            'drivers': args.drivers,
+            'jobs': args.jobs,
+            'workers': args.workers,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'started_at': datetime.utcnow().isoformat(),
+        },
+        'worker_classes': {},
+    }
+    base_url = f'http://127.0.0.1:{args.port}'
+    for worker_class in WORKER_ARGS:
+        server = start_server(worker_class, args.workers, args.port)
+        try:
+            login = urllib.request.Request(base_url + '/login', headers={'Authorization': f'Basic {credentials}'})
+            with urllib.request.urlopen(login, timeout=60) as response:
+                headers = {'x-access-token': json.loads(response.read())['token']}
+            results = report['worker_classes'][worker_class] = {}
+            for name, path in endpoints.items():
+                results[name] = run(base_url, path, headers, args.requests, args.concurrency)
+                print(f'{worker_class} {name}: {results[name]}', file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
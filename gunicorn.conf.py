@@ -0,0 +1,6 @@
+def post_fork(server, worker):
+    # Under the gevent worker, let psycopg2 yield to other greenlets while it waits
+    # on Postgres instead of blocking every request in the worker.
+    if worker.__class__.__name__ == 'GeventWorker':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -1,11 +1,87 @@
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
+from datetime import datetime, timedelta
 
-from src.main import app, migrate
+from src.main import app, bcrypt, migrate, publisher
+from src.models import User, Job
+from src import loader
+from src.archive import archive_completed
+from src.idempotency import idempotency_store
+from src import search, stats
 
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
+@manager.command
+def publish_events():
+    """Drain the Pusher outbox in the foreground."""
+    publisher.run()
+
+@manager.command
+def retry_failed_events():
+    """Queue the outbox events that were given up on for another attempt."""
+    print(f'{publisher.retry_failed()} events queued again')
+
+def report(what):
+    return lambda total: print(f'{total} {what}')
+
+@manager.option('-n', '--count', dest='count', type=int, default=1000, help='Number of users')
+@manager.option('-p', '--password', dest='password', default='password', help='Password shared by every user')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=loader.BATCH_SIZE)
+def seed_users(count, password, batch_size):
+    """Generate confirmed users that all share one password, hashed once."""
+    password_hash = bcrypt.generate_password_hash(password)
+    rows = loader.synthetic_users(count, password_hash, start=loader.next_user_number())
+    loader.load(User, rows, batch_size, progress=report('users loaded'))
+
+@manager.option('-n', '--count', dest='count', type=int, default=100000, help='Number of jobs')
+@manager.option('-s', '--seed', dest='seed', type=int, default=0, help='Random seed')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=loader.BATCH_SIZE)
+def seed_jobs(count, seed, batch_size):
+    """Generate jobs spread over the last year, assigned to the existing confirmed users."""
+    rows = loader.synthetic_jobs(count, loader.confirmed_user_ids(), seed=seed)
+    loader.load(Job, rows, batch_size, progress=report('jobs loaded'))
+
+@manager.option('path', help='CSV file with a header row, or .ndjson file')
+@manager.option('-p', '--password', dest='password', default=None,
+                help='Password for records without a password or password_hash')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=loader.BATCH_SIZE)
+def import_users(path, password, batch_size):
+    """Load users from a CSV or NDJSON file."""
+    password_hash = bcrypt.generate_password_hash(password) if password else None
+    rows = loader.imported_users(loader.read_records(path), password_hash)
+    loader.load(User, rows, batch_size, progress=report('users loaded'))
+
+@manager.option('path', help='CSV file with a header row, or .ndjson file')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=loader.BATCH_SIZE)
+def import_jobs(path, batch_size):
+    """Load jobs from a CSV or NDJSON file; driver_id holds a user's public id."""
+    rows = loader.imported_jobs(loader.read_records(path), batch_size)
+    loader.load(Job, rows, batch_size, progress=report('jobs loaded'))
+
+@manager.option('-d', '--days', dest='days', type=int, default=365, help='Archive jobs picked up more than this many days ago')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000)
+@manager.option('-p', '--pause', dest='pause', type=float, default=0, help='Seconds to wait between batches')
+def archive_jobs(days, batch_size, pause):
+    """Move old completed jobs to jobs_archive; safe to interrupt and run again."""
+    before = datetime.utcnow() - timedelta(days=days)
+    archive_completed(before, batch_size, pause, progress=report('jobs archived'))
+
+@manager.command
+def rebuild_stats():
+    """Recompute the driver_stats summary table from every live and archived job."""
+    print(f'{stats.rebuild()} driver days rebuilt')
+
+@manager.command
+def rebuild_search():
+    """Rebuild the job search index, e.g. after restoring a backup."""
+    search.rebuild()
+
+@manager.command
+def purge_idempotency_keys():
+    """Delete Idempotency-Key responses older than IDEMPOTENCY_TTL."""
+    print(f'{idempotency_store.purge()} keys deleted')
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""jobs archive table
+
+Revision ID: 275bd764e70f
+Revises: a1776738bd82
+Create Date: 2026-10-18 19:12:40.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '275bd764e70f'
+down_revision = 'a1776738bd82'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('public_id', sa.String(length=64), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('change_seq', sa.Integer(), nullable=True),
+    sa.Column('number_of_people', sa.Integer(), nullable=True),
+    sa.Column('_pickup_time', sa.DateTime(), nullable=True),
+    sa.Column('name', sa.String(length=64), nullable=True),
+    sa.Column('contact_number', sa.String(length=64), nullable=True),
+    sa.Column('time_allowed', sa.Integer(), nullable=True),
+    sa.Column('price', sa.Integer(), nullable=True),
+    sa.Column('is_complete', sa.Boolean(), nullable=True),
+    sa.Column('_driver_id', sa.Integer(), nullable=True),
+    sa.Column('pickup_house', sa.String(length=64), nullable=True),
+    sa.Column('pickup_road', sa.String(length=64), nullable=True),
+    sa.Column('pickup_village', sa.String(length=64), nullable=True),
+    sa.Column('pickup_postcode', sa.String(length=64), nullable=True),
+    sa.Column('dropoff_house', sa.String(length=64), nullable=True),
+    sa.Column('dropoff_road', sa.String(length=64), nullable=True),
+    sa.Column('dropoff_village', sa.String(length=64), nullable=True),
+    sa.Column('dropoff_postcode', sa.String(length=64), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['_driver_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_jobs_archive__driver_id'), 'jobs_archive', ['_driver_id'], unique=False)
+    op.create_index(op.f('ix_jobs_archive_public_id'), 'jobs_archive', ['public_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_jobs_archive_public_id'), table_name='jobs_archive')
+    op.drop_index(op.f('ix_jobs_archive__driver_id'), table_name='jobs_archive')
+    op.drop_table('jobs_archive')
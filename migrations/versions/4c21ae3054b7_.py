@@ -0,0 +1,40 @@
+"""row versions and table change counters
+
+Revision ID: 4c21ae3054b7
+Revises: f2fb2ec0f2de
+Create Date: 2026-10-18 16:12:39.550214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+
+# revision identifiers, used by Alembic.
+revision = '4c21ae3054b7'
+down_revision = 'f2fb2ec0f2de'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_versions = op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [
+        {'name': 'users', 'version': 1, 'updated_at': datetime.utcnow()},
+        {'name': 'jobs', 'version': 1, 'updated_at': datetime.utcnow()},
+    ])
+    op.add_column('users', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('jobs', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('jobs') as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('version')
+    op.drop_table('table_versions')
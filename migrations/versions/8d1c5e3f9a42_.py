@@ -0,0 +1,59 @@
+"""driver stats summary table
+
+Revision ID: 8d1c5e3f9a42
+Revises: 275bd764e70f
+Create Date: 2026-10-18 19:58:12.604381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1c5e3f9a42'
+down_revision = '275bd764e70f'
+branch_labels = None
+depends_on = None
+
+
+def per_job(table_name):
+    table = sa.table(table_name, sa.column('_driver_id', sa.Integer), sa.column('_pickup_time', sa.DateTime),
+                     sa.column('is_complete', sa.Boolean), sa.column('price', sa.Integer),
+                     sa.column('number_of_people', sa.Integer))
+    c = table.c
+    completed = c.is_complete.is_(True)
+    return (sa.select([c._driver_id.label('driver_id'),
+                       sa.func.date(c._pickup_time).label('day'),
+                       sa.case([(completed, 1)], else_=0).label('completed_jobs'),
+                       sa.case([(completed, sa.func.coalesce(c.price, 0))], else_=0).label('revenue'),
+                       sa.case([(completed & (c.number_of_people > 0), c.number_of_people)], else_=0)
+                       .label('passengers')])
+            .where(c._driver_id.isnot(None) & c._pickup_time.isnot(None)))
+
+
+def upgrade():
+    stats = op.create_table('driver_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('driver_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('jobs', sa.Integer(), nullable=False),
+    sa.Column('completed_jobs', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Integer(), nullable=False),
+    sa.Column('passengers', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['driver_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('driver_id', 'day', name='uq_driver_stats_driver_id_day')
+    )
+
+    # Backfill from every live and archived job; `manage.py rebuild_stats` does the same
+    jobs = sa.union_all(per_job('jobs'), per_job('jobs_archive')).alias('jobs')
+    totals = (sa.select([jobs.c.driver_id, jobs.c.day, sa.func.count(),
+                         sa.func.sum(jobs.c.completed_jobs), sa.func.sum(jobs.c.revenue),
+                         sa.func.sum(jobs.c.passengers)])
+              .group_by(jobs.c.driver_id, jobs.c.day))
+    op.execute(stats.insert().from_select(
+        ['driver_id', 'day', 'jobs', 'completed_jobs', 'revenue', 'passengers'], totals))
+
+
+def downgrade():
+    op.drop_table('driver_stats')
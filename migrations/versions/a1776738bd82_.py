@@ -0,0 +1,48 @@
+"""updated_at, change feed sequence and tombstones
+
+Revision ID: a1776738bd82
+Revises: 4c21ae3054b7
+Create Date: 2026-10-18 16:48:05.230967
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1776738bd82'
+down_revision = '4c21ae3054b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('public_id', sa.String(length=64), nullable=False),
+    sa.Column('change_seq', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_table_name_change_seq', 'tombstones', ['table_name', 'change_seq'], unique=False)
+
+    now = datetime.utcnow()
+    for table_name in ('users', 'jobs'):
+        op.add_column(table_name, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.add_column(table_name, sa.Column('change_seq', sa.Integer(), nullable=True))
+        # Existing rows sort before every later change, so since=0 returns them all
+        table = sa.table(table_name, sa.column('updated_at', sa.DateTime), sa.column('change_seq', sa.Integer))
+        op.execute(table.update().values(updated_at=now, change_seq=1))
+        op.create_index(op.f(f'ix_{table_name}_change_seq'), table_name, ['change_seq'], unique=False)
+
+
+def downgrade():
+    for table_name in ('jobs', 'users'):
+        op.drop_index(op.f(f'ix_{table_name}_change_seq'), table_name=table_name)
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column('change_seq')
+            batch_op.drop_column('updated_at')
+    op.drop_index('ix_tombstones_table_name_change_seq', table_name='tombstones')
+    op.drop_table('tombstones')
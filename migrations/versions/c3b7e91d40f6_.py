@@ -0,0 +1,67 @@
+"""job search index
+
+Revision ID: c3b7e91d40f6
+Revises: 8d1c5e3f9a42
+Create Date: 2026-10-18 20:41:37.182054
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3b7e91d40f6'
+down_revision = '8d1c5e3f9a42'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(contact_number, '') || ' ' || "
+    "replace(coalesce(contact_number, ''), ' ', '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(pickup_road, '') || ' ' || coalesce(pickup_village, '') || ' ' || "
+    "coalesce(pickup_postcode, '') || ' ' || replace(coalesce(pickup_postcode, ''), ' ', '') || ' ' || "
+    "coalesce(dropoff_road, '') || ' ' || coalesce(dropoff_village, '') || ' ' || "
+    "coalesce(dropoff_postcode, '') || ' ' || replace(coalesce(dropoff_postcode, ''), ' ', '')), 'B')"
+)
+
+FTS_VALUES = (
+    "{row}.name, "
+    "coalesce({row}.contact_number, '') || ' ' || replace(coalesce({row}.contact_number, ''), ' ', ''), "
+    "coalesce({row}.pickup_road, '') || ' ' || coalesce({row}.pickup_village, '') || ' ' || "
+    "coalesce({row}.pickup_postcode, '') || ' ' || replace(coalesce({row}.pickup_postcode, ''), ' ', '') || ' ' || "
+    "coalesce({row}.dropoff_road, '') || ' ' || coalesce({row}.dropoff_village, '') || ' ' || "
+    "coalesce({row}.dropoff_postcode, '') || ' ' || replace(coalesce({row}.dropoff_postcode, ''), ' ', '')"
+)
+
+SEARCHED_COLUMNS = ('name, contact_number, pickup_road, pickup_village, pickup_postcode, '
+                    'dropoff_road, dropoff_village, dropoff_postcode')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(f'CREATE INDEX ix_jobs_search ON jobs USING gin (({SEARCH_DOCUMENT}))')
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE jobs_fts USING fts5(name, contact, address, "
+                   "tokenize = 'unicode61 remove_diacritics 2')")
+        op.execute(f'CREATE TRIGGER jobs_fts_insert AFTER INSERT ON jobs BEGIN '
+                   f'INSERT INTO jobs_fts (rowid, name, contact, address) VALUES (new.id, {FTS_VALUES.format(row="new")}); '
+                   f'END')
+        op.execute('CREATE TRIGGER jobs_fts_delete AFTER DELETE ON jobs BEGIN '
+                   'DELETE FROM jobs_fts WHERE rowid = old.id; '
+                   'END')
+        op.execute(f'CREATE TRIGGER jobs_fts_update AFTER UPDATE OF {SEARCHED_COLUMNS} ON jobs BEGIN '
+                   f'DELETE FROM jobs_fts WHERE rowid = old.id; '
+                   f'INSERT INTO jobs_fts (rowid, name, contact, address) VALUES (new.id, {FTS_VALUES.format(row="new")}); '
+                   f'END')
+        op.execute(f'INSERT INTO jobs_fts (rowid, name, contact, address) SELECT jobs.id, {FTS_VALUES.format(row="jobs")} FROM jobs')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_jobs_search', table_name='jobs')
+    elif dialect == 'sqlite':
+        for trigger in ('jobs_fts_update', 'jobs_fts_delete', 'jobs_fts_insert'):
+            op.execute(f'DROP TRIGGER {trigger}')
+        op.execute('DROP TABLE jobs_fts')
@@ -0,0 +1,48 @@
+"""unique public ids and job lookup indexes
+
+Revision ID: e9f4eb0bd7ea
+Revises: d0ef73177d9a
+Create Date: 2026-10-18 15:02:11.402178
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import uuid
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9f4eb0bd7ea'
+down_revision = 'd0ef73177d9a'
+branch_labels = None
+depends_on = None
+
+
+def backfill_public_ids(table_name):
+    """Give every row without a public id, or sharing one with an older row, a fresh uuid."""
+    table = sa.table(table_name, sa.column('id', sa.Integer), sa.column('public_id', sa.String))
+    conn = op.get_bind()
+    seen = set()
+    rows = conn.execute(sa.select([table.c.id, table.c.public_id]).order_by(table.c.id)).fetchall()
+    for row_id, public_id in rows:
+        if public_id is not None and public_id not in seen:
+            seen.add(public_id)
+            continue
+        conn.execute(table.update().where(table.c.id == row_id).values(public_id=str(uuid.uuid4())))
+
+
+def upgrade():
+    backfill_public_ids('users')
+    backfill_public_ids('jobs')
+    op.create_index(op.f('ix_users_public_id'), 'users', ['public_id'], unique=True)
+    op.create_index(op.f('ix_jobs_public_id'), 'jobs', ['public_id'], unique=True)
+    op.create_index(op.f('ix_jobs__pickup_time'), 'jobs', ['_pickup_time'], unique=False)
+    op.create_index(op.f('ix_jobs__driver_id'), 'jobs', ['_driver_id'], unique=False)
+    op.create_index(op.f('ix_jobs_is_complete'), 'jobs', ['is_complete'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_jobs_is_complete'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs__driver_id'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs__pickup_time'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs_public_id'), table_name='jobs')
+    op.drop_index(op.f('ix_users_public_id'), table_name='users')
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import time
+
+from .main import db
+from .models import Job, ArchivedJob, TableVersion
+
+
+def archive_completed(before, batch_size=1000, pause=0, progress=None):
+    """Move completed jobs picked up before ``before`` from ``jobs`` to ``jobs_archive``.
+
+    Jobs move ``batch_size`` at a time, each batch copied and deleted in its own short
+    transaction, so locks are held briefly and an interrupted run can simply be started
+    again. ``pause`` seconds between batches leave room for live traffic. Each batch
+    bumps the ``jobs`` table version so cached listings are revalidated. Returns the
+    number of jobs moved.
+    """
+    jobs = Job.__table__
+    columns = [column.name for column in jobs.columns]
+    total = 0
+    while True:
+        query = (db.session.query(Job.id)
+                 .filter(Job.is_complete.is_(True), Job._pickup_time < before)
+                 .order_by(Job.id)
+                 .limit(batch_size))
+        if db.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        ids = [job_id for job_id, in query]
+        if not ids:
+            break
+        now = datetime.utcnow()
+        select = db.select([jobs.c[name] for name in columns] + [db.literal(now).label('archived_at')])
+        db.session.execute(ArchivedJob.__table__.insert()
+                           .from_select(columns + ['archived_at'], select.where(jobs.c.id.in_(ids))))
+        db.session.execute(jobs.delete().where(jobs.c.id.in_(ids)))
+        TableVersion.bump('jobs')
+        db.session.commit()
+        total += len(ids)
+        if progress is not None:
+            progress(total)
+        if pause:
+            time.sleep(pause)
+    return total
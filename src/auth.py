@@ -0,0 +1,106 @@
+from flask import request, jsonify, g
+from collections import namedtuple
+from functools import wraps
+import hashlib
+import hmac
+import time
+import jwt
+
+from .main import app
+from .models import User
+from .cache import TTLCache
+
+
+class CredentialCache:
+    """Remembers Basic-auth credentials that recently passed a bcrypt check.
+
+    Entries are keyed on the username and an HMAC of the username and password, so the
+    password itself is never stored. The value is the password hash the credentials were
+    checked against; a hit only counts if the user's current hash still matches, so a
+    password changed by another process can never be satisfied from the cache.
+    """
+    def __init__(self, maxsize, ttl):
+        self.cache = TTLCache(maxsize, ttl)
+
+    def key(self, username, password):
+        message = f'{username}\0{password}'.encode('utf-8')
+        digest = hmac.new(app.config['SECRET_KEY'].encode('utf-8'), message, hashlib.sha256).digest()
+        return (username, digest)
+
+    def check(self, user, password):
+        """Check ``password`` against ``user``, running bcrypt only on a cache miss."""
+        key = self.key(user.username, password)
+        if user.password_hash is not None and self.cache.get(key) == user.password_hash:
+            return True
+        if user.check_password(password):
+            self.cache.set(key, user.password_hash)
+            return True
+        return False
+
+    def invalidate(self, username):
+        """Forget every cached credential for ``username``."""
+        self.cache.discard_if(lambda key, value: key[0] == username)
+
+
+# The authenticated caller, available as ``g.principal`` inside routes.
+# ``claims`` is the decoded token payload, or None for Basic auth.
+Principal = namedtuple('Principal', ['public_id', 'user_id', 'claims'])
+
+
+class TokenCache:
+    """Remembers tokens that passed signature verification until they expire.
+
+    The cached ``Principal`` carries the resolved ``User`` primary key, so repeated
+    requests with the same token skip both ``jwt.decode`` and the user lookup.
+    """
+    def __init__(self, maxsize, ttl):
+        self.cache = TTLCache(maxsize, ttl)
+
+    def principal(self, token):
+        """Return the principal for ``token``; raises ``jwt.InvalidTokenError`` if it is invalid."""
+        principal = self.cache.get(token)
+        if principal is not None:
+            return principal
+        claims = jwt.decode(token, app.config['SECRET_KEY'])
+        user = User.get_by_public_id(claims.get('public_id'))
+        principal = Principal(claims.get('public_id'), user.id if user else None, claims)
+        ttl = claims['exp'] - time.time() if 'exp' in claims else None
+        if ttl is None or ttl > 0:
+            self.cache.set(token, principal, ttl)
+        return principal
+
+    def invalidate(self, public_id):
+        """Forget every cached token issued to ``public_id``."""
+        self.cache.discard_if(lambda key, value: value.public_id == public_id)
+
+
+credential_cache = CredentialCache(app.config['AUTH_CACHE_SIZE'], app.config['AUTH_CACHE_TTL'])
+token_cache = TokenCache(app.config['TOKEN_CACHE_SIZE'], app.config['TOKEN_CACHE_TTL'])
+
+
+# Auth decorators
+def auth_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = None
+        if 'x-access-token' in request.headers:
+            token = request.headers['x-access-token']
+        if token:
+            try:
+                g.principal = token_cache.principal(token)
+            except:
+                return jsonify({'Error': 'Token is invalid'}), 401
+        elif request.authorization:
+            auth = request.authorization
+            user = User.query.filter_by(username=auth.username).first()
+            if not user:
+                return jsonify({'Error': 'Token is missing'}), 401
+            if not credential_cache.check(user, auth.password):
+                return jsonify({'Error': 'Invalid auth credentials'}), 401
+            if not user.confirmed:
+                return jsonify({'Error': 'User not confirmed'}), 401
+            g.principal = Principal(user.public_id, user.id, None)
+        else:
+            return jsonify({'Error': 'Token is missing'}), 401
+        return f(*args, **kwargs)
+    return decorated
@@ -0,0 +1,347 @@
+from flask import json
+from sqlalchemy import event
+from collections import deque
+
+import logging
+import queue
+import threading
+
+from .main import app, db
+from .models import Job, JobSchema, OutboxEvent, TableVersion
+
+logger = logging.getLogger(__name__)
+
+job_schema = JobSchema()
+
+KEEPALIVE = ': keepalive\n\n'
+RESET = 'event: reset\ndata: {}\n\n'
+
+
+def format_event(seq, name, data):
+    return f'id: {seq}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscription:
+    """One Server-Sent Events client, with a bounded queue of pending messages.
+
+    A client that falls ``SSE_QUEUE_SIZE`` messages behind is cut off with a ``reset``
+    event instead of buffering without limit; it should resync from ``/job/changes``.
+    """
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def push(self, message):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def messages(self, heartbeat):
+        """Yield messages as they arrive, with a keepalive comment every ``heartbeat`` seconds."""
+        while True:
+            if self.overflowed and self.queue.empty():
+                yield RESET
+                return
+            try:
+                yield self.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield KEEPALIVE
+
+
+class JobBroker:
+    """In-process pub/sub of job changes for Server-Sent Events subscribers.
+
+    A poller thread follows the job change feed (``Job.changes``) and publishes every
+    change, with its ``change_seq`` as the event id. Following the feed rather than the
+    request hooks means subscribers see writes made by every worker process; commits in
+    this process wake the poller straight away. The last ``SSE_BUFFER_SIZE`` events are
+    kept in a ring buffer so a reconnecting client can resume from ``Last-Event-ID``.
+
+    All of the broker's database work happens in its own thread, with that thread's
+    session; callers in request threads only wait for it.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.subscribers = set()
+        self.listeners = []
+        self.indexes = []
+        self.buffer = deque()
+        self.cursor = None
+        self.floor = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='job-broker', daemon=True)
+                self._thread.start()
+
+    def prime(self):
+        """Start following the change feed from its current position."""
+        with self.app.app_context():
+            try:
+                cursor = TableVersion.current(['jobs'])['jobs'][0]
+            finally:
+                db.session.remove()
+        with self._lock:
+            self.cursor = self.floor = cursor
+        self._ready.set()
+
+    def reset(self):
+        """Follow the feed from its current position again and rebuild every index.
+
+        For when the database has been replaced, e.g. restored from a backup.
+        """
+        with self._lock:
+            self._ready.clear()
+            self.cursor = self.floor = None
+            self.buffer.clear()
+            indexes = list(self.indexes)
+        for index in indexes:
+            index.reset()
+
+    def wake(self):
+        if self._thread is not None:
+            self._wake.set()
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber, replaying buffered events after ``last_event_id``.
+
+        Returns None if the broker could not read its starting position within
+        ``SSE_READY_TIMEOUT`` seconds, e.g. because the database is unreachable.
+        """
+        self.start()
+        if not self._ready.wait(self.app.config['SSE_READY_TIMEOUT']):
+            return None
+        subscription = Subscription(self.app.config['SSE_QUEUE_SIZE'])
+        with self._lock:
+            if last_event_id is not None:
+                if last_event_id < self.floor:
+                    subscription.push(RESET)
+                else:
+                    for seq, message in self.buffer:
+                        if seq > last_event_id:
+                            subscription.push(message)
+            self.subscribers.add(subscription)
+        return subscription
+
+    def add_listener(self, listener):
+        """Call ``listener(seq, job, deleted_public_id)`` for every change the poller sees."""
+        with self._lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def add_index(self, index):
+        """Have the broker thread build ``index`` and feed it every change after that."""
+        self.add_listener(index.changed)
+        with self._lock:
+            if index not in self.indexes:
+                self.indexes.append(index)
+        self.start()
+        self._wake.set()
+
+    def build_indexes(self):
+        """Build the indexes that are waiting to be built."""
+        with self._lock:
+            pending = [index for index in self.indexes if index.cursor is None]
+        for index in pending:
+            with self.app.app_context():
+                try:
+                    index.build()
+                except Exception:
+                    logger.exception('Building %s failed', type(index).__name__)
+                finally:
+                    db.session.remove()
+                    index.built.set()
+
+    def committed(self, jobs):
+        """Apply ``{public_id: job or None}`` committed by this process to the built indexes."""
+        with self._lock:
+            indexes = list(self.indexes)
+        for index in indexes:
+            try:
+                index.committed(jobs)
+            except Exception:
+                logger.exception('Applying committed jobs to %s failed', type(index).__name__)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, seq, message):
+        with self._lock:
+            self.buffer.append((seq, message))
+            while len(self.buffer) > self.app.config['SSE_BUFFER_SIZE']:
+                self.floor = self.buffer.popleft()[0]
+            self.cursor = seq
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.push(message)
+
+    def run(self):
+        while True:
+            try:
+                if self.cursor is None:
+                    self.prime()
+                self.build_indexes()
+                self.poll()
+            except Exception:
+                logger.exception('Job broker poll failed')
+            self._wake.wait(self.app.config['SSE_POLL_INTERVAL'])
+            self._wake.clear()
+
+    def poll(self):
+        """Publish every job change committed since the last poll."""
+        with self.app.app_context():
+            try:
+                while True:
+                    changes = Job.changes(self.cursor, self.app.config['SSE_POLL_BATCH'])
+                    for seq, job, public_id in changes:
+                        for listener in list(self.listeners):
+                            try:
+                                listener(seq, job, public_id)
+                            except Exception:
+                                logger.exception('Job broker listener failed')
+                        if job is None:
+                            message = format_event(seq, 'deleted-job', {'public_id': public_id})
+                        elif job.version == 1:
+                            message = format_event(seq, 'new-job', job_schema.dump(job))
+                        else:
+                            message = format_event(seq, 'updated-job', job_schema.dump(job))
+                        self.publish(seq, message)
+                    if len(changes) < self.app.config['SSE_POLL_BATCH']:
+                        break
+            finally:
+                db.session.remove()
+
+
+broker = JobBroker(app)
+
+
+class JobIndex:
+    """Base for in-memory views of jobs that are kept up to date from the change feed.
+
+    The view is built on first use, in the broker thread: the feed position is read,
+    then the snapshot is loaded, then changes made since that position are applied.
+    After that the broker poller feeds it every change. Subclasses implement ``clear``,
+    ``load`` and ``apply``; ``apply`` receives the current job, or None and the public id
+    of a deleted job, and must be idempotent.
+    """
+    def __init__(self, broker):
+        self.broker = broker
+        self.cursor = None
+        self.built = threading.Event()
+        self._lock = threading.RLock()
+
+    def ensure(self):
+        """Wait until the view is built, asking the broker thread to build it on first use.
+
+        The build reads the database with the broker thread's session, so the caller's
+        session, and anything pending in it, is left alone.
+        """
+        if self.cursor is None:
+            self.broker.add_index(self)
+            self.built.wait()
+            if self.cursor is None:
+                raise RuntimeError(f'{type(self).__name__} could not be built')
+
+    def build(self):
+        with self._lock:
+            cursor = TableVersion.current(['jobs'])['jobs'][0]
+            self.clear()
+            self.load()
+            batch_size = self.broker.app.config['SSE_POLL_BATCH']
+            while True:
+                changes = Job.changes(cursor, batch_size)
+                for seq, job, public_id in changes:
+                    self.apply(job, public_id)
+                    cursor = seq
+                if len(changes) < batch_size:
+                    break
+            self.cursor = cursor
+
+    def reset(self):
+        with self._lock:
+            self.built.clear()
+            self.cursor = None
+
+    def committed(self, jobs):
+        """Apply jobs this process has just committed, without waiting for the poller.
+
+        The cursor is left alone: the poller still delivers these changes, and changes
+        from other processes committed before them, and ``apply`` is idempotent.
+        """
+        with self._lock:
+            if self.cursor is None:
+                return
+            for public_id, job in jobs.items():
+                self.apply(job, public_id)
+
+    def changed(self, seq, job, public_id):
+        with self._lock:
+            if self.cursor is None or seq <= self.cursor:
+                return
+            self.apply(job, public_id)
+            self.cursor = seq
+
+    def clear(self):
+        raise NotImplementedError
+
+    def load(self):
+        raise NotImplementedError
+
+    def apply(self, job, public_id):
+        raise NotImplementedError
+
+
+class JobSnapshot:
+    """The job columns the indexes read, copied at flush time to apply after the commit."""
+    __slots__ = ('public_id', '_driver_id', '_pickup_time', 'time_allowed', 'is_complete', 'pickup_postcode')
+
+    def __init__(self, values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+        if self.is_complete is None:
+            self.is_complete = False
+
+    @classmethod
+    def of(cls, job):
+        return cls({name: getattr(job, name) for name in cls.__slots__})
+
+
+def track_job(session, public_id, job):
+    """Record a job written in ``session``, or None if it was deleted, for the indexes."""
+    session.info.setdefault('indexed_jobs', {})[public_id] = job
+
+
+@event.listens_for(db.session, 'after_flush')
+def job_event_written(session, flush_context):
+    if any(isinstance(instance, OutboxEvent) for instance in session.new):
+        session.info['broker_pending'] = True
+    for job in list(session.new) + list(session.dirty):
+        if isinstance(job, Job):
+            track_job(session, job.public_id, JobSnapshot.of(job))
+    for job in session.deleted:
+        if isinstance(job, Job):
+            track_job(session, job.public_id, None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def job_event_committed(session):
+    jobs = session.info.pop('indexed_jobs', None)
+    if jobs:
+        broker.committed(jobs)
+    if session.info.pop('broker_pending', False):
+        broker.wake()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def job_event_rolled_back(session):
+    session.info.pop('broker_pending', None)
+    session.info.pop('indexed_jobs', None)
@@ -0,0 +1,101 @@
+from flask import g, has_app_context
+from collections import OrderedDict
+
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire ``ttl`` seconds after they are set.
+
+    Holds at most ``maxsize`` entries; the least recently used one is evicted first.
+    Each process has its own, so entries are not shared between gunicorn workers.
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] <= time.monotonic():
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, ttl=None):
+        """Store ``value``, expiring after ``ttl`` seconds or the cache default."""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def discard_if(self, predicate):
+        """Remove every entry for which ``predicate(key, value)`` is true."""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class IdentityCache:
+    """Read-through cache for ``CRUDModel.get_by_public_id``.
+
+    Maps ``(table, public_id)`` to the instance for the rest of the current app context,
+    i.e. the current request, so repeated lookups of the same row cost one SELECT.
+    Nothing is kept between requests: each request has a new session, so reusing a row
+    from an earlier one would still need a SELECT to check it is current.
+    """
+    def __init__(self):
+        self.request_hits = 0
+        self.misses = 0
+
+    def request_map(self):
+        if not has_app_context():
+            return {}
+        if 'identity_map' not in g:
+            g.identity_map = {}
+        return g.identity_map
+
+    def lookup(self, model, public_id):
+        key = (model.__tablename__, public_id)
+        identity_map = self.request_map()
+        instance = identity_map.get(key)
+        if instance is not None:
+            self.request_hits += 1
+            return instance
+
+        self.misses += 1
+        instance = model.query.filter_by(public_id=public_id).first()
+        if instance is not None:
+            identity_map[key] = instance
+        return instance
+
+    def invalidate(self, model, public_id):
+        key = (model.__tablename__, public_id)
+        self.request_map().pop(key, None)
+
+    def stats(self):
+        return {'request_hits': self.request_hits, 'misses': self.misses}
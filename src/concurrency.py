@@ -0,0 +1,21 @@
+import sys
+
+
+def cooperative():
+    """True when gevent has patched the standard library, as under gunicorn's gevent worker."""
+    if 'gevent.monkey' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def offload(function, *args):
+    """Call ``function(*args)``; under gevent, run it on the hub's native thread pool.
+
+    For CPU-bound calls that release the GIL, such as bcrypt: run on the event loop they
+    would stall every other request in the worker for their whole duration.
+    """
+    if not cooperative():
+        return function(*args)
+    import gevent
+    return gevent.get_hub().threadpool.apply(function, args)
@@ -0,0 +1,68 @@
+from flask import request, make_response
+from functools import wraps
+import hashlib
+
+from .main import db
+from .models import TableVersion
+
+
+def not_modified(etag, last_modified=None):
+    """True when the request's validators show the client already has this representation."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def respond(view, etag, last_modified, args, kwargs):
+    if not_modified(etag, last_modified):
+        response = make_response('', 304)
+    else:
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def conditional(*tables):
+    """Answer conditional GETs on a listing from the change versions of ``tables``.
+
+    The ETag combines the table versions with the request path, query string and Accept
+    header. A matching ``If-None-Match`` gets a 304 before the view runs its query.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            versions = TableVersion.current(tables)
+            key = '|'.join([request.full_path, request.headers.get('Accept', '')] +
+                           [f'{name}:{versions[name][0]}' for name in tables])
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            updated = [updated_at for _, updated_at in versions.values() if updated_at]
+            return respond(f, etag, max(updated) if updated else None, args, kwargs)
+        return decorated
+    return decorator
+
+
+def conditional_row(model, *tables):
+    """Answer conditional GETs on a single ``model`` row from its version column.
+
+    ``tables`` are the related tables whose rows are nested in the response; their
+    change versions are part of the ETag too.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            row = db.session.query(model.version, model.updated_at).filter_by(public_id=kwargs['id']).first()
+            if row is None:
+                return f(*args, **kwargs)
+            versions = TableVersion.current(tables)
+            etag = '-'.join([kwargs['id'], str(row.version)] + [str(versions[name][0]) for name in tables])
+            updated = [row.updated_at] + [updated_at for _, updated_at in versions.values()]
+            updated = [updated_at for updated_at in updated if updated_at]
+            return respond(f, etag, max(updated) if updated else None, args, kwargs)
+        return decorated
+    return decorator
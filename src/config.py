@@ -14,8 +14,54 @@ class Config:
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_QUEUE_WORKERS = 2
+    MAIL_CONNECTION_IDLE = 10
+    MAIL_MAX_RETRIES = 3
+    MAIL_RETRY_BACKOFF = 5
 
     CORS_HEADERS = 'Content-Type'
+    CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'Link', 'Idempotent-Replayed']
+
+    AUTH_CACHE_SIZE = 10000
+    AUTH_CACHE_TTL = 300
+    TOKEN_CACHE_SIZE = 10000
+    TOKEN_CACHE_TTL = 300
+
+    IDEMPOTENCY_TTL = 86400
+
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    STREAM_BATCH_SIZE = 500
+    BULK_MAX_JOBS = 5000
+
+    FAST_SERIALIZERS = True
+    FAST_JSON = True
+
+    SLOW_REQUEST_THRESHOLD = float(os.environ['SLOW_REQUEST_THRESHOLD']) if os.environ.get('SLOW_REQUEST_THRESHOLD') else None
+
+    PUSHER_APP_ID = os.environ.get('PUSHER_APP_ID') or '885511'
+    PUSHER_KEY = os.environ.get('PUSHER_KEY') or 'eb76090e47a74e0751c0'
+    PUSHER_SECRET = os.environ.get('PUSHER_SECRET') or 'b87d7bb0cc422930140f'
+    PUSHER_CLUSTER = os.environ.get('PUSHER_CLUSTER') or 'eu'
+    PUSHER_STUB = bool(os.environ.get('PUSHER_STUB'))
+
+    OUTBOX_PUBLISHER_THREAD = True
+    OUTBOX_BATCH_SIZE = 100
+    OUTBOX_POLL_INTERVAL = 5
+    OUTBOX_RETRY_BACKOFF = 1
+    OUTBOX_MAX_BACKOFF = 60
+    OUTBOX_MAX_ATTEMPTS = 10
+
+    SSE_BUFFER_SIZE = 1000
+    SSE_QUEUE_SIZE = 100
+    SSE_HEARTBEAT = 15
+    SSE_POLL_INTERVAL = 1
+    SSE_POLL_BATCH = 500
+    # Seconds a request waits for the broker to read its starting position, e.g. at startup
+    SSE_READY_TIMEOUT = 5
+
+    DISPATCH_BUCKET_MINUTES = 60
+    DISPATCH_WINDOW_MINUTES = 120
 
 class Development(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'db.sqlite')
@@ -27,7 +73,34 @@ class Production(Config):
 
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI =  os.environ.get('DATABASE_URL')
+    # A gevent worker runs up to --worker-connections requests at once; the pool caps how
+    # many of them hold a database connection, the rest wait up to pool_timeout for one
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 30)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_pre_ping': True,
+    }
 
-    
+class Benchmark(Config):
+    DEBUG = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'bench.sqlite')
+    if (os.environ.get('BENCH_DATABASE_URL') or '').startswith('postgres'):
+        SQLALCHEMY_ENGINE_OPTIONS = Production.SQLALCHEMY_ENGINE_OPTIONS
+
+    PUSHER_STUB = True
+    OUTBOX_PUBLISHER_THREAD = False
+    MAIL_SUPPRESS_SEND = True
+    MAIL_QUEUE_WORKERS = 0
 
+class Testing(Config):
+    TESTING = True
+    DEBUG = False
+    # A file rather than :memory:, so the broker thread gets its own connection
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'test.sqlite')
+    BCRYPT_LOG_ROUNDS = 4
 
+    PUSHER_STUB = True
+    OUTBOX_PUBLISHER_THREAD = False
+    MAIL_SUPPRESS_SEND = True
+    MAIL_QUEUE_WORKERS = 0
@@ -0,0 +1,118 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+
+from .main import app, db
+from .models import Job
+from .broker import broker, JobIndex
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def postcode_areas(postcode):
+    """Return the outward code and sector of a UK postcode, e.g. ``('CB1', 'CB1 2')`` for ``'cb1 2ab'``."""
+    if not postcode:
+        return ()
+    compact = ''.join(postcode.split()).upper()
+    if len(compact) < 5:
+        return (compact,)
+    outward, inward = compact[:-3], compact[-3:]
+    return (outward, f'{outward} {inward[0]}')
+
+
+def area_key(value):
+    """Normalise a dispatch ``area``: an outward code, a sector or a full postcode."""
+    parts = value.upper().split()
+    if len(parts) == 2 and parts[1][0].isdigit():
+        return f'{parts[0]} {parts[1][0]}'
+    if len(parts) == 1:
+        return postcode_areas(parts[0])[-1]
+    raise ValueError(f'Invalid area: {value}')
+
+
+class DispatchIndex(JobIndex):
+    """Open jobs (not complete, no driver) by pickup area and pickup time.
+
+    Every outward code and sector maps to buckets of ``DISPATCH_BUCKET_MINUTES``, each a
+    list of ``(pickup_time, public_id)`` kept sorted, so a lookup bisects only the buckets
+    its window covers and an update only shifts one small list.
+    """
+    def clear(self):
+        self.bucket_seconds = app.config['DISPATCH_BUCKET_MINUTES'] * 60
+        self.areas = {}
+        self.jobs = {}
+
+    def bucket_of(self, time):
+        return int((time - EPOCH).total_seconds() // self.bucket_seconds)
+
+    def load(self):
+        query = (db.session.query(Job.public_id, Job.pickup_postcode, Job._pickup_time)
+                 .filter(Job.is_complete.is_(False), Job._driver_id.is_(None))
+                 .yield_per(app.config['STREAM_BATCH_SIZE']))
+        for public_id, postcode, pickup_time in query:
+            self.add(public_id, postcode, pickup_time, append=True)
+        for buckets in self.areas.values():
+            for entries in buckets.values():
+                entries.sort()
+
+    def apply(self, job, public_id):
+        self.remove(job.public_id if job is not None else public_id)
+        if job is not None and not job.is_complete and job._driver_id is None:
+            self.add(job.public_id, job.pickup_postcode, job._pickup_time)
+
+    def add(self, public_id, postcode, pickup_time, append=False):
+        areas = postcode_areas(postcode)
+        if not areas or pickup_time is None:
+            return
+        self.jobs[public_id] = (areas, pickup_time)
+        bucket = self.bucket_of(pickup_time)
+        for area in areas:
+            entries = self.areas.setdefault(area, {}).setdefault(bucket, [])
+            if append:
+                entries.append((pickup_time, public_id))
+            else:
+                insort(entries, (pickup_time, public_id))
+
+    def remove(self, public_id):
+        entry = self.jobs.pop(public_id, None)
+        if entry is None:
+            return
+        areas, pickup_time = entry
+        bucket = self.bucket_of(pickup_time)
+        for area in areas:
+            buckets = self.areas[area]
+            entries = buckets[bucket]
+            i = bisect_left(entries, (pickup_time, public_id))
+            if i < len(entries) and entries[i] == (pickup_time, public_id):
+                del entries[i]
+            if not entries:
+                del buckets[bucket]
+                if not buckets:
+                    del self.areas[area]
+
+    def lookup(self, area, start, end, limit):
+        """Return the public ids of up to ``limit`` open jobs in ``area`` picked up in ``[start, end)``."""
+        self.ensure()
+        with self._lock:
+            buckets = self.areas.get(area)
+            if not buckets or start >= end:
+                return []
+            first, last = self.bucket_of(start), self.bucket_of(end)
+            numbers = range(first, last + 1)
+            if len(numbers) > len(buckets):
+                numbers = sorted(number for number in buckets if first <= number <= last)
+            public_ids = []
+            for number in numbers:
+                entries = buckets.get(number)
+                if not entries:
+                    continue
+                for i in range(bisect_left(entries, (start,)), len(entries)):
+                    pickup_time, public_id = entries[i]
+                    if pickup_time >= end:
+                        return public_ids
+                    public_ids.append(public_id)
+                    if len(public_ids) == limit:
+                        return public_ids
+            return public_ids
+
+
+dispatch_index = DispatchIndex(broker)
@@ -0,0 +1,149 @@
+from flask import request, g, json, jsonify, make_response
+from functools import wraps
+from datetime import datetime, timedelta
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+import hashlib
+import threading
+
+from .main import app, db
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """Responses of requests sent with an ``Idempotency-Key``, replayed on retries.
+
+    Keys are rows of ``idempotency_keys``, unique per endpoint, caller and key. The row
+    is inserted before the view runs, so it commits in the same transaction as whatever
+    the view creates, like an outbox event. A retry that reaches another worker while
+    the original is running waits on the unique index until that transaction ends, then
+    gets the stored response, or a 409 if it is not stored yet. Within a process requests
+    with the same key also hold a per-key lock, so such a retry waits for the response.
+    Keys expire ``ttl`` seconds after they are first used.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scope):
+        with self._lock:
+            entry = self._locks.get(scope)
+            if entry is None:
+                entry = self._locks[scope] = [threading.Lock(), 0]
+            entry[1] += 1
+        entry[0].acquire()
+
+    def release(self, scope):
+        with self._lock:
+            entry = self._locks[scope]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[scope]
+
+    def expiry(self):
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def lookup(self, scope):
+        endpoint, principal, key = scope
+        return IdempotencyKey.query.filter_by(endpoint=endpoint, principal=principal, key=key).first()
+
+    def replay(self, stored, fingerprint):
+        if stored is not None and stored.fingerprint != fingerprint:
+            return jsonify({'Error': 'Idempotency-Key was already used for a different request'}), 422
+        if stored is None or stored.status is None:
+            return jsonify({'Error': 'A request with this Idempotency-Key is still in progress'}), 409
+        response = app.response_class(stored.body, status=stored.status, headers=json.loads(stored.headers))
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def respond(self, scope, fingerprint, view):
+        """Return the stored response for ``scope``, or run ``view`` and store what it returns."""
+        self.acquire(scope)
+        try:
+            stored = self.lookup(scope)
+            if stored is not None and stored.created_at < self.expiry():
+                db.session.delete(stored)
+                db.session.flush()
+                stored = None
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+            stored = self.add(scope, fingerprint)
+            try:
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                return self.replay(self.lookup(scope), fingerprint)
+            try:
+                response = make_response(view())
+            except Exception:
+                db.session.rollback()
+                self.forget(stored)
+                raise
+            # Server errors may be transient, so the client's retry should run again
+            if response.status_code >= 500:
+                db.session.rollback()
+                self.forget(stored)
+            else:
+                self.store(stored, scope, fingerprint, response)
+            return response
+        finally:
+            self.release(scope)
+
+    def add(self, scope, fingerprint):
+        endpoint, principal, key = scope
+        stored = IdempotencyKey(endpoint=endpoint, principal=principal, key=key, fingerprint=fingerprint)
+        db.session.add(stored)
+        return stored
+
+    def store(self, stored, scope, fingerprint, response):
+        if not inspect(stored).persistent:
+            # The view rolled back, and the key's row with it
+            stored = self.add(scope, fingerprint)
+        stored.status = response.status_code
+        # Content-Length is recomputed from the body when the response is replayed
+        stored.headers = json.dumps([(name, value) for name, value in response.headers.items()
+                                     if name != 'Content-Length'])
+        stored.body = response.get_data()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A retry on another worker ran the view after our rollback and stored its own
+            db.session.rollback()
+
+    def forget(self, stored):
+        if inspect(stored).persistent:
+            db.session.delete(stored)
+            db.session.commit()
+
+    def purge(self):
+        """Delete the expired keys; returns how many were deleted."""
+        count = IdempotencyKey.query.filter(IdempotencyKey.created_at < self.expiry()).delete()
+        db.session.commit()
+        return count
+
+
+idempotency_store = IdempotencyStore(app.config['IDEMPOTENCY_TTL'])
+
+
+def idempotent(f):
+    """Replay the first response to requests repeated with the same ``Idempotency-Key`` header.
+
+    Keys are scoped to the endpoint and, after ``auth_required``, to the caller. A key
+    reused with a different body gets a 422 rather than the stored response.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return f(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'Error': 'Invalid Idempotency-Key'}), 400
+        principal = g.get('principal')
+        scope = (request.endpoint, principal.public_id if principal else '', key)
+        fingerprint = hashlib.sha1(request.get_data()).hexdigest()
+        return idempotency_store.respond(scope, fingerprint, lambda: f(*args, **kwargs))
+    return decorated
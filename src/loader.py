@@ -0,0 +1,257 @@
+from flask import json
+from datetime import datetime, timedelta
+
+import csv
+import hashlib
+import io
+import itertools
+import random
+import uuid
+
+from .main import db, bcrypt
+from .models import User, TableVersion
+from . import stats
+
+BATCH_SIZE = 10000
+TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+ADDRESS_FIELDS = ('house', 'road', 'village', 'postcode')
+
+
+def read_records(path):
+    """Yield the records of a CSV file with a header row, or of an NDJSON file, one at a time."""
+    with open(path, newline='') as f:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def blank(value):
+    return None if value == '' else value
+
+
+def to_int(value):
+    value = blank(value)
+    return None if value is None else int(value)
+
+
+def to_bool(value):
+    value = blank(value)
+    if value is None or isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 't', 'true', 'y', 'yes')
+
+
+def to_time(value):
+    value = blank(value)
+    if value is None or isinstance(value, datetime):
+        return value
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid time: {value}')
+
+
+def user_row(record, password_hash):
+    """Convert an imported user to ``users`` column values.
+
+    ``password_hash`` is used for records that carry neither a ``password_hash`` nor a
+    ``password``; hashing a plain ``password`` runs bcrypt, so prefer hashes for big files.
+    """
+    if not blank(record.get('username')) or not blank(record.get('email')):
+        raise ValueError('username and email are required')
+    row = {
+        'public_id': blank(record.get('public_id')) or str(uuid.uuid4()),
+        'username': record['username'],
+        'email': record['email'],
+        'avatar_hash': blank(record.get('avatar_hash')) or hashlib.md5(record['email'].lower().encode('utf-8')).hexdigest(),
+        'confirmed': bool(to_bool(record.get('confirmed'))),
+    }
+    if blank(record.get('last_active')) is not None:
+        row['last_active'] = to_time(record['last_active'])
+    if blank(record.get('password_hash')):
+        row['password_hash'] = record['password_hash'].encode('utf-8')
+    elif blank(record.get('password')):
+        row['password_hash'] = bcrypt.generate_password_hash(record['password'])
+    else:
+        row['password_hash'] = password_hash
+    return row
+
+
+JOB_COLUMNS = {'number_of_people': to_int, 'name': str, 'contact_number': str,
+               'time_allowed': to_int, 'price': to_int, 'is_complete': to_bool}
+
+
+def job_row(record, drivers):
+    """Convert an imported job to ``jobs`` column values.
+
+    Addresses may be nested objects, as in the API, or flat ``pickup_postcode`` style
+    columns, as in CSV. ``drivers`` maps driver public ids to user ids.
+    """
+    row = {'public_id': blank(record.get('public_id')) or str(uuid.uuid4())}
+    for column, convert in JOB_COLUMNS.items():
+        if blank(record.get(column)) is not None:
+            row[column] = convert(record[column])
+    if blank(record.get('pickup_time')) is not None:
+        row['_pickup_time'] = to_time(record['pickup_time'])
+    for prefix in ('pickup', 'dropoff'):
+        address = record.get(f'{prefix}_address')
+        for field in ADDRESS_FIELDS:
+            value = address.get(field) if isinstance(address, dict) else record.get(f'{prefix}_{field}')
+            row[f'{prefix}_{field}'] = blank(value)
+    driver_id = blank(record.get('driver_id'))
+    if driver_id is not None:
+        if driver_id not in drivers:
+            raise ValueError(f'Unknown driver: {driver_id}')
+        row['_driver_id'] = drivers[driver_id]
+    return row
+
+
+def imported_users(records, password_hash):
+    for number, record in enumerate(records, 1):
+        try:
+            yield user_row(record, password_hash)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'Record {number}: {e}') from e
+
+
+def imported_jobs(records, batch_size=BATCH_SIZE):
+    """Convert imported jobs, resolving the drivers of each batch with one query."""
+    number = 0
+    for batch in batches(records, batch_size):
+        driver_ids = {blank(record.get('driver_id')) for record in batch} - {None}
+        drivers = {}
+        if driver_ids:
+            drivers = dict(db.session.query(User.public_id, User.id).filter(User.public_id.in_(driver_ids)))
+        for record in batch:
+            number += 1
+            try:
+                yield job_row(record, drivers)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f'Record {number}: {e}') from e
+
+
+def synthetic_users(count, password_hash, prefix='driver', start=0):
+    """Generate confirmed users that all share ``password_hash``."""
+    for i in range(start, start + count):
+        email = f'{prefix}{i}@example.com'
+        yield {'public_id': str(uuid.uuid4()), 'username': f'{prefix}{i}', 'email': email,
+               'password_hash': password_hash, 'avatar_hash': hashlib.md5(email.encode('utf-8')).hexdigest(),
+               'confirmed': True}
+
+
+def synthetic_jobs(count, driver_ids, days=365, seed=0):
+    """Generate jobs spread evenly over the last ``days`` days, mostly complete and assigned."""
+    rng = random.Random(seed)
+    end = datetime.utcnow()
+    step = timedelta(days=days) / max(count, 1)
+    for i in range(count):
+        yield {
+            'public_id': str(uuid.uuid4()),
+            'number_of_people': rng.randint(1, 6), 'name': f'Customer {i}',
+            'contact_number': f'07{rng.randint(100000000, 999999999)}',
+            '_pickup_time': end - step * (count - i), 'time_allowed': 30, 'price': rng.randint(500, 5000),
+            'is_complete': rng.random() < 0.8,
+            '_driver_id': rng.choice(driver_ids) if driver_ids and rng.random() < 0.9 else None,
+            'pickup_house': str(rng.randint(1, 200)), 'pickup_road': 'Mill Road', 'pickup_village': 'Cambridge',
+            'pickup_postcode': f'CB{rng.randint(1, 25)} {rng.randint(1, 9)}AB',
+            'dropoff_house': str(rng.randint(1, 200)), 'dropoff_road': 'Hills Road', 'dropoff_village': 'Cambridge',
+            'dropoff_postcode': f'CB{rng.randint(1, 25)} {rng.randint(1, 9)}CD',
+        }
+
+
+def fill_defaults(table, row):
+    """Add the column defaults the ORM would have applied, so every row has every column."""
+    for column in table.columns:
+        if column.key in row or column.primary_key:
+            continue
+        default = column.default
+        if default is None:
+            row[column.key] = None
+        elif default.is_callable:
+            row[column.key] = default.arg(None)
+        else:
+            row[column.key] = default.arg
+    return row
+
+
+def copy_value(value):
+    """Format ``value`` for PostgreSQL's COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, bytes):
+        value = '\\x' + value.hex()
+    elif isinstance(value, datetime):
+        value = value.isoformat(' ')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(table, rows):
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(row[column]) for column in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    quote = db.engine.dialect.identifier_preparer.quote
+    statement = f'COPY {quote(table.name)} ({", ".join(quote(column) for column in columns)}) FROM STDIN'
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def load(model, rows, batch_size=BATCH_SIZE, progress=None):
+    """Insert ``rows`` into ``model``'s table, committing every ``batch_size`` rows.
+
+    Only one batch is held in memory. Each batch reserves a block of change sequence
+    numbers, so the loaded rows appear in the change feed like any other write, and
+    loaded jobs are counted in ``driver_stats``. On
+    PostgreSQL batches are sent with COPY, elsewhere with one executemany INSERT.
+    Batches already committed stay loaded if a later one fails. Returns the row count.
+    """
+    table = model.__table__
+    use_copy = db.engine.dialect.name == 'postgresql'
+    total = 0
+    for batch in batches(rows, batch_size):
+        now = datetime.utcnow()
+        last_seq = TableVersion.bump(model.__tablename__, by=len(batch))
+        for seq, row in enumerate(batch, last_seq - len(batch) + 1):
+            row['change_seq'] = seq
+            row['updated_at'] = now
+            fill_defaults(table, row)
+        if use_copy:
+            copy_rows(table, batch)
+        else:
+            db.session.execute(table.insert(), batch)
+        if model.__tablename__ == 'jobs':
+            stats.record_rows(batch)
+        db.session.commit()
+        total += len(batch)
+        if progress is not None:
+            progress(total)
+    return total
+
+
+def next_user_number():
+    return (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+
+
+def confirmed_user_ids():
+    return [user_id for user_id, in db.session.query(User.id).filter(User.confirmed.is_(True))]
@@ -0,0 +1,81 @@
+import logging
+import queue
+import threading
+
+from .main import app, mail
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class MailQueue:
+    """Sends Flask-Mail messages from a pool of background threads.
+
+    Each worker keeps its SMTP connection open while there is mail waiting and closes it
+    after ``MAIL_CONNECTION_IDLE`` seconds without messages. Failed messages are queued
+    again after an exponential backoff, up to ``MAIL_MAX_RETRIES`` times. The queue lives in
+    memory, so messages still waiting when the process exits are lost.
+    """
+    def __init__(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self.queue = queue.Queue()
+        self.workers = []
+        self._lock = threading.Lock()
+
+    def send(self, msg):
+        """Queue a message for delivery, or send it inline when no workers are configured."""
+        if self.app.config['MAIL_QUEUE_WORKERS'] <= 0:
+            with timed('smtp'):
+                self.mail.send(msg)
+            return
+        self.start()
+        self.queue.put((msg, 0))
+
+    def start(self):
+        """Start the worker threads if they are not already running."""
+        with self._lock:
+            self.workers = [w for w in self.workers if w.is_alive()]
+            for i in range(len(self.workers), self.app.config['MAIL_QUEUE_WORKERS']):
+                worker = threading.Thread(target=self.run, name=f'mail-queue-{i}', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def join(self):
+        """Block until every queued message has been sent or scheduled for a retry."""
+        self.queue.join()
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                item = self.queue.get()
+                try:
+                    with self.mail.connect() as connection:
+                        while item is not None:
+                            with timed('smtp'):
+                                connection.send(item[0])
+                            self.queue.task_done()
+                            item = self.next_message()
+                except Exception:
+                    logger.exception('Sending mail failed')
+                    if item is not None:
+                        self.retry(*item)
+                        self.queue.task_done()
+
+    def next_message(self):
+        try:
+            return self.queue.get(timeout=self.app.config['MAIL_CONNECTION_IDLE'])
+        except queue.Empty:
+            return None
+
+    def retry(self, msg, attempts):
+        if attempts >= self.app.config['MAIL_MAX_RETRIES']:
+            logger.error('Giving up on mail to %s after %d attempts', msg.recipients, attempts + 1)
+            return
+        delay = self.app.config['MAIL_RETRY_BACKOFF'] * 2 ** attempts
+        timer = threading.Timer(delay, self.queue.put, args=((msg, attempts + 1),))
+        timer.daemon = True
+        timer.start()
+
+
+mail_queue = MailQueue(app, mail)
@@ -21,6 +21,8 @@ mail = Mail(app)
 CORS(app)
 
 from src.models import User, Job
+from src.outbox import publisher
+from src import metrics
 from src.routes import api
 
 app.register_blueprint(api)
\ No newline at end of file
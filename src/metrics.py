@@ -0,0 +1,229 @@
+from flask import request, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from contextlib import contextmanager
+
+import logging
+import threading
+import time
+
+from .main import app
+from .models import identity_cache
+from .auth import credential_cache, token_cache
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            lines.extend(self.render_value(labels, value))
+        return lines
+
+    def render_value(self, labels, value):
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, value, *labels):
+        """Mirror a counter that is kept elsewhere, e.g. by a cache."""
+        with self._lock:
+            self.values[labels] = value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, value, *labels):
+        with self._lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render_value(self, labels, counts):
+        lines = [f'{self.name}_bucket{format_labels(self.labelnames, labels, [("le", bound)])} {count}'
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f'{self.name}_bucket{format_labels(self.labelnames, labels, [("le", "+Inf")])} {counts[-1]}')
+        lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {counts[-2]}')
+        lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} {counts[-1]}')
+        return lines
+
+
+registry = []
+collectors = []
+
+request_duration = Histogram('http_request_duration_seconds', 'Time to produce a response.',
+                             ('method', 'endpoint'))
+requests_total = Counter('http_requests_total', 'Requests handled.', ('method', 'endpoint', 'status'))
+request_queries = Histogram('http_request_sql_queries', 'SQL statements executed per request.',
+                            ('method', 'endpoint'), QUERY_COUNT_BUCKETS)
+request_sql_duration = Histogram('http_request_sql_duration_seconds', 'Time spent in SQL per request.',
+                                 ('method', 'endpoint'))
+sql_statements = Counter('sql_statements_total', 'SQL statements executed, including background work.')
+external_duration = Histogram('external_call_duration_seconds', 'Duration of calls to Pusher and SMTP.',
+                              ('service',))
+external_errors = Counter('external_call_errors_total', 'Failed calls to Pusher and SMTP.', ('service',))
+pool_checkouts = Counter('db_pool_checkouts_total', 'Connections checked out of the pool.')
+pool_in_use = Gauge('db_pool_connections_in_use', 'Connections currently checked out of the pool.')
+cache_lookups = Counter('cache_lookups_total', 'Cache lookups by outcome.', ('cache', 'result'))
+
+
+def collect_cache_stats():
+    for result, count in identity_cache.stats().items():
+        cache_lookups.set(count, 'identity', result)
+    for name, cache in (('credentials', credential_cache.cache), ('tokens', token_cache.cache)):
+        cache_lookups.set(cache.hits, name, 'hits')
+        cache_lookups.set(cache.misses, name, 'misses')
+
+
+collectors.append(collect_cache_stats)
+
+
+@contextmanager
+def timed(service):
+    """Record the duration of a call to an external ``service``, and whether it failed."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        external_errors.inc(service)
+        raise
+    finally:
+        external_duration.observe(time.perf_counter() - start, service)
+
+
+def render():
+    """Render every metric in the Prometheus text exposition format."""
+    lines = []
+    for collect in collectors:
+        collect()
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    sql_statements.inc()
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+        if g.sql_statements is not None:
+            g.sql_statements.append((elapsed, statement))
+
+
+@event.listens_for(Engine, 'handle_error')
+def cursor_execute_failed(context):
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+
+@event.listens_for(Pool, 'checkout')
+def pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_checkouts.inc()
+    pool_in_use.inc()
+
+
+@event.listens_for(Pool, 'checkin')
+def pool_checkin(dbapi_connection, connection_record):
+    pool_in_use.inc(amount=-1)
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    g.sql_statements = [] if app.config['SLOW_REQUEST_THRESHOLD'] is not None else None
+
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request_metrics(exc):
+    if 'request_start' not in g:
+        return
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = g.get('response_status', 500)
+    request_duration.observe(elapsed, request.method, endpoint)
+    requests_total.inc(request.method, endpoint, status)
+    request_queries.observe(g.sql_count, request.method, endpoint)
+    request_sql_duration.observe(g.sql_time, request.method, endpoint)
+
+    threshold = app.config['SLOW_REQUEST_THRESHOLD']
+    if threshold is not None and elapsed >= threshold:
+        statements = '\n'.join(f'  {duration * 1000:.1f} ms  {statement}' for duration, statement in g.sql_statements)
+        logger.warning('Slow request: %s %s %d took %.1f ms with %d SQL statements (%.1f ms)\n%s',
+                       request.method, request.full_path, status, elapsed * 1000,
+                       g.sql_count, g.sql_time * 1000, statements)
+
+
+@app.route('/metrics')
+def metrics():
+    return app.response_class(render(), mimetype='text/plain; version=0.0.4')
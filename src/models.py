@@ -1,18 +1,27 @@
 from datetime import datetime
-from flask import request
+from flask import request, json
 
+from sqlalchemy import inspect
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import joinedload
 
 import hashlib
 import uuid
 
 from .main import db, ma, bcrypt, app
+from .cache import IdentityCache
+from .concurrency import offload
+
+identity_cache = IdentityCache()
 
 
 class CRUDModel(db.Model):
     """Mixin that adds convenience methods for CRUD (create, read, update, delete) operations."""
     id = db.Column(db.Integer, primary_key=True)
-    public_id = db.Column(db.String(64), default=str(uuid.uuid4()))
+    public_id = db.Column(db.String(64), default=lambda: str(uuid.uuid4()), unique=True, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.Integer, index=True)
     __abstract__ = True
 
     @classmethod
@@ -24,9 +33,9 @@ class CRUDModel(db.Model):
 
     @classmethod
     def get_by_public_id(cls, record_id):
-        """Get record by ID."""
+        """Get record by public ID, through the identity cache."""
         if isinstance(record_id, str):
-            return cls.query.filter_by(public_id=str(record_id)).first()
+            return identity_cache.lookup(cls, record_id)
         return None
 
     @classmethod
@@ -39,17 +48,48 @@ class CRUDModel(db.Model):
         """Update specific fields of a record."""
         for attr, value in kwargs.items():
             setattr(self, attr, value)
-        return commit and self.save() or self
+        return self.save(commit=commit)
+
+    def patch(self, commit=True, **kwargs):
+        """Update the given fields, saving only if one of them actually changed value.
+
+        Returns the names of the changed fields. The flush UPDATE names only the changed
+        columns, and a patch that changes nothing writes nothing.
+        """
+        changed = []
+        for attr, value in kwargs.items():
+            before = getattr(self, attr)
+            setattr(self, attr, value)
+            if getattr(self, attr) != before:
+                changed.append(attr)
+        if changed:
+            self.save(commit=commit)
+        return changed
 
     def save(self, commit=True):
-        """Save the record."""
+        """Save the record, bumping its version and its table's version if it changed.
+
+        The new table version becomes the row's ``change_seq``, its position in the
+        table's change feed.
+        """
+        persistent = inspect(self).persistent
+        if not persistent or db.session.is_modified(self):
+            if persistent:
+                self.version = type(self).version + 1
+            self.updated_at = datetime.utcnow()
+            self.change_seq = TableVersion.bump(self.__tablename__)
+            if persistent:
+                identity_cache.invalidate(type(self), self.public_id)
         db.session.add(self)
         if commit:
             db.session.commit()
         return self
 
     def delete(self, commit=True):
-        """Remove the record from the database."""
+        """Remove the record from the database, leaving a tombstone in the change feed."""
+        db.session.add(Tombstone(table_name=self.__tablename__, public_id=self.public_id,
+                                 change_seq=TableVersion.bump(self.__tablename__)))
+        identity_cache.invalidate(type(self), self.public_id)
         db.session.delete(self)
         return commit and db.session.commit()
 
@@ -70,13 +110,57 @@ def reference_col(tablename, nullable=False, pk_name="id", foreign_key_kwargs=No
         **column_kwargs
     )
 
+class TableVersion(db.Model):
+    """Change counter for a table, bumped in the same transaction as every write to it."""
+    __tablename__ = "table_versions"
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def bump(cls, name, by=1):
+        """Increment the version of table ``name`` and return the new value.
+
+        The UPDATE locks the counter row until the transaction ends, so versions are
+        handed out in commit order.
+        """
+        table = cls.__table__
+        now = datetime.utcnow()
+        result = db.session.execute(table.update()
+                                    .where(table.c.name == name)
+                                    .values(version=table.c.version + by, updated_at=now))
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(name=name, version=by, updated_at=now))
+            return by
+        return db.session.execute(db.select([table.c.version]).where(table.c.name == name)).scalar()
+
+    @classmethod
+    def current(cls, names):
+        """Return ``{name: (version, updated_at)}`` for the given tables."""
+        rows = db.session.query(cls.name, cls.version, cls.updated_at).filter(cls.name.in_(names))
+        versions = {name: (0, None) for name in names}
+        versions.update((name, (version, updated_at)) for name, version, updated_at in rows)
+        return versions
+
+
+class Tombstone(db.Model):
+    """Marker left by a deleted row so change feeds can report the deletion."""
+    __tablename__ = "tombstones"
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    public_id = db.Column(db.String(64), nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_tombstones_table_name_change_seq', 'table_name', 'change_seq'),)
+
+
 class User(CRUDModel):
     __tablename__ = "users"
     username = db.Column(db.String(64), unique=True)
     email = db.Column(db.String(128) , unique=True)
     password_hash = db.Column(db.Binary(128))
     last_active = db.Column(db.DateTime, default=datetime.utcnow)
-    jobs = db.relationship('Job', backref='driver', lazy='dynamic')
+    jobs = db.relationship('Job', backref='driver')
     avatar_hash = db.Column(db.String(128))
     confirmed = db.Column(db.Boolean, default=False)
 
@@ -93,11 +177,11 @@ class User(CRUDModel):
     @password.setter
     def password(self, value):
         """Set password."""
-        self.password_hash = bcrypt.generate_password_hash(value)
+        self.password_hash = offload(bcrypt.generate_password_hash, value)
 
     def check_password(self, value):
         """Check password."""
-        return bcrypt.check_password_hash(self.password_hash, value)
+        return offload(bcrypt.check_password_hash, self.password_hash, value)
 
     def gravatar(self, size=150, default="identicon", rating="g"):
         if request.is_secure:
@@ -122,31 +206,8 @@ class UserSchemaMinimal(ma.Schema):
     jobs = ma.UrlFor('.get_user_jobs', id='<public_id>')
 
 
-class Job(CRUDModel):
-    __tablename__ = "jobs"
-    number_of_people = db.Column(db.Integer, default=-1)
-    _pickup_time = db.Column(db.DateTime, default=datetime.utcnow)
-    name = db.Column(db.String(64), default="No Name")
-    contact_number = db.Column(db.String(64), default="No Contact")
-    time_allowed = db.Column(db.Integer, default=30)
-    price = db.Column(db.Integer, default=0)
-    is_complete = db.Column(db.Boolean, default=False)
-    _driver_id = reference_col("users", nullable=True)
-
-    pickup_house = db.Column(db.String(64))
-    pickup_road = db.Column(db.String(64))
-    pickup_village = db.Column(db.String(64))
-    pickup_postcode = db.Column(db.String(64))
-
-    dropoff_house = db.Column(db.String(64))
-    dropoff_road = db.Column(db.String(64))
-    dropoff_village = db.Column(db.String(64))
-    dropoff_postcode = db.Column(db.String(64))
-
-    def __init__(self, **kwargs):
-        db.Model.__init__(self, **kwargs)
-        self.driver_id = None
-
+class JobFields:
+    """Computed job attributes shared by live and archived jobs."""
     @hybrid_property
     def pickup_address(self):
         return {
@@ -200,9 +261,166 @@ class Job(CRUDModel):
             driver = User.get_by_public_id(value)
             self.driver = driver
 
+
+class Job(JobFields, CRUDModel):
+    __tablename__ = "jobs"
+    archived = False
+    number_of_people = db.Column(db.Integer, default=-1)
+    _pickup_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    name = db.Column(db.String(64), default="No Name")
+    contact_number = db.Column(db.String(64), default="No Contact")
+    time_allowed = db.Column(db.Integer, default=30)
+    price = db.Column(db.Integer, default=0)
+    is_complete = db.Column(db.Boolean, default=False, index=True)
+    _driver_id = reference_col("users", nullable=True, column_kwargs={'index': True})
+
+    pickup_house = db.Column(db.String(64))
+    pickup_road = db.Column(db.String(64))
+    pickup_village = db.Column(db.String(64))
+    pickup_postcode = db.Column(db.String(64))
+
+    dropoff_house = db.Column(db.String(64))
+    dropoff_road = db.Column(db.String(64))
+    dropoff_village = db.Column(db.String(64))
+    dropoff_postcode = db.Column(db.String(64))
+
+    def __init__(self, **kwargs):
+        db.Model.__init__(self, **kwargs)
+        self.driver_id = None
+
+    @classmethod
+    def get_by_public_id(cls, record_id):
+        """Get a job by public ID, falling back to the archive for jobs moved out of ``jobs``."""
+        job = super().get_by_public_id(record_id)
+        if job is None and isinstance(record_id, str):
+            job = ArchivedJob.query.filter_by(public_id=record_id).first()
+        return job
+
+    @classmethod
+    def with_driver(cls):
+        """Query jobs with their driver loaded in the same SELECT."""
+        return cls.query.options(joinedload(cls.driver))
+
+    @classmethod
+    def changes(cls, since, limit):
+        """Return up to ``limit`` ``(seq, job, deleted_public_id)`` changes after ``since``, in order.
+
+        Exactly one of ``job`` and ``deleted_public_id`` is set.
+        """
+        jobs = (cls.with_driver()
+                .filter(cls.change_seq > since)
+                .order_by(cls.change_seq)
+                .limit(limit).all())
+        deleted = (Tombstone.query
+                   .filter(Tombstone.table_name == cls.__tablename__, Tombstone.change_seq > since)
+                   .order_by(Tombstone.change_seq)
+                   .limit(limit).all())
+        changes = [(job.change_seq, job, None) for job in jobs]
+        changes += [(tombstone.change_seq, None, tombstone.public_id) for tombstone in deleted]
+        return sorted(changes, key=lambda change: change[0])[:limit]
+
+class ArchivedJob(JobFields, db.Model):
+    """A completed job moved out of ``jobs`` by the archive command; read-only."""
+    __tablename__ = "jobs_archive"
+    archived = True
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    public_id = db.Column(db.String(64), unique=True, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime)
+    change_seq = db.Column(db.Integer)
+    number_of_people = db.Column(db.Integer)
+    _pickup_time = db.Column(db.DateTime)
+    name = db.Column(db.String(64))
+    contact_number = db.Column(db.String(64))
+    time_allowed = db.Column(db.Integer)
+    price = db.Column(db.Integer)
+    is_complete = db.Column(db.Boolean)
+    _driver_id = reference_col("users", nullable=True, foreign_key_kwargs={'ondelete': 'SET NULL'},
+                               column_kwargs={'index': True})
+    driver = db.relationship('User', viewonly=True)
+
+    pickup_house = db.Column(db.String(64))
+    pickup_road = db.Column(db.String(64))
+    pickup_village = db.Column(db.String(64))
+    pickup_postcode = db.Column(db.String(64))
+
+    dropoff_house = db.Column(db.String(64))
+    dropoff_road = db.Column(db.String(64))
+    dropoff_village = db.Column(db.String(64))
+    dropoff_postcode = db.Column(db.String(64))
+
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def for_driver(cls, user_id):
+        """Archived jobs of a driver, in the order ``GET /user/<id>/jobs`` lists jobs."""
+        return (cls.query.options(joinedload(cls.driver))
+                .filter(cls._driver_id == user_id)
+                .order_by(cls._pickup_time, cls.id))
+
+
 class JobSchema(ma.ModelSchema):
     class Meta:
         model = Job
         fields = ('public_id', 'number_of_people', 'pickup_time', 'name', 'contact_number', 'time_allowed', 'price', 'is_complete', 'driver', 'dropoff_address', 'pickup_address')
     
     driver = ma.Nested(UserSchemaMinimal)
+
+
+class DriverStats(db.Model):
+    """Per-driver, per-day job totals, kept up to date by ``src.stats`` as jobs change.
+
+    ``jobs`` counts every job assigned to the driver on that pickup day; revenue and
+    passengers count completed jobs only.
+    """
+    __tablename__ = "driver_stats"
+    __table_args__ = (db.UniqueConstraint('driver_id', 'day', name='uq_driver_stats_driver_id_day'),)
+    id = db.Column(db.Integer, primary_key=True)
+    driver_id = reference_col("users", foreign_key_kwargs={'ondelete': 'CASCADE'})
+    day = db.Column(db.Date, nullable=False)
+    jobs = db.Column(db.Integer, nullable=False, default=0)
+    completed_jobs = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+    passengers = db.Column(db.Integer, nullable=False, default=0)
+
+
+class OutboxEvent(db.Model):
+    """Pusher event written in the same transaction as the change it announces."""
+    __tablename__ = "outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(64), nullable=False)
+    event = db.Column(db.String(64), nullable=False)
+    key = db.Column(db.String(64))
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, default=0)
+    # Set when the event is given up on; failed events stay in the table but are not sent
+    failed_at = db.Column(db.DateTime)
+
+    @classmethod
+    def enqueue(cls, channel, event, data, key=None):
+        """Add an event to the session; it is committed along with the surrounding change."""
+        instance = cls(channel=channel, event=event, key=key, payload=json.dumps(data))
+        db.session.add(instance)
+        return instance
+
+    @property
+    def data(self):
+        return json.loads(self.payload)
+
+
+class IdempotencyKey(db.Model):
+    """Response to a request sent with an ``Idempotency-Key``, replayed to its retries."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (db.UniqueConstraint('endpoint', 'principal', 'key'),)
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(64), nullable=False)
+    # The caller's public id, or '' for unauthenticated endpoints
+    principal = db.Column(db.String(64), nullable=False, default='')
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    # Null while the first request with the key is still running
+    status = db.Column(db.Integer)
+    headers = db.Column(db.Text)
+    body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,231 @@
+from flask import json
+from sqlalchemy import event
+from pusher.errors import PusherBadRequest
+from datetime import datetime
+
+import logging
+import threading
+import pusher
+
+from .main import app, db
+from .models import OutboxEvent
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Pusher accepts at most this many events per trigger_batch call
+PUSHER_BATCH_LIMIT = 10
+# and at most this many bytes of encoded data per event
+PUSHER_DATA_LIMIT = 10240
+
+# Pusher will never accept these events as they are, so retrying them is pointless; the
+# client library raises ValueError itself for events over the size limit
+REJECTED = (ValueError, PusherBadRequest)
+
+
+class StubPusher:
+    """In-memory stand-in for ``pusher.Pusher`` that records what would have been sent."""
+    def __init__(self):
+        self.events = []
+
+    def trigger(self, channels, event_name, data):
+        self.events.append({'channel': channels, 'name': event_name, 'data': data})
+
+    def trigger_batch(self, batch, already_encoded=False):
+        for pusher_event in batch:
+            data = pusher_event['data'] if already_encoded else json.dumps(pusher_event['data'])
+            if len(data) > PUSHER_DATA_LIMIT:
+                raise ValueError('Too much data')
+        self.events.extend(batch)
+
+
+def make_pusher_client(config):
+    if config['PUSHER_STUB']:
+        return StubPusher()
+    return pusher.Pusher(
+        app_id=config['PUSHER_APP_ID'],
+        key=config['PUSHER_KEY'],
+        secret=config['PUSHER_SECRET'],
+        cluster=config['PUSHER_CLUSTER'],
+        ssl=True
+    )
+
+
+def coalesce(events):
+    """Split a batch into the events to send and the ones superseded by a later event.
+
+    An ``updated-job`` or ``patched-job`` event is superseded by any later full update or
+    delete of the same job, since clients only need the latest state. Patches carry only
+    the fields they changed, so they never supersede anything themselves.
+    """
+    send, superseded, seen = [], [], set()
+    for outbox_event in reversed(events):
+        if outbox_event.event in ('updated-job', 'patched-job') and outbox_event.key in seen:
+            superseded.append(outbox_event)
+            continue
+        if outbox_event.key is not None and outbox_event.event in ('updated-job', 'deleted-job'):
+            seen.add(outbox_event.key)
+        send.append(outbox_event)
+    send.reverse()
+    return send, superseded
+
+
+class OutboxPublisher:
+    """Background worker that drains the outbox table into Pusher.
+
+    Events are read in id order, coalesced, sent with ``trigger_batch`` and deleted once
+    Pusher has accepted them. On failure the events stay in the table and the worker backs
+    off exponentially before trying again. Rows are claimed with ``SKIP LOCKED`` so several
+    processes can drain the same table.
+
+    An event Pusher rejects outright, or one that has failed ``OUTBOX_MAX_ATTEMPTS`` times,
+    is marked failed and skipped from then on, so it cannot hold up the events behind it.
+    A rejected batch is retried one event at a time to find the culprit.
+    """
+    def __init__(self, app, client):
+        self.app = app
+        self.client = client
+        self.failures = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread if it is not already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='outbox-publisher', daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """Wake the worker because new events have been committed."""
+        if self.app.config['OUTBOX_PUBLISHER_THREAD']:
+            self.start()
+            self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.backoff() or self.app.config['OUTBOX_POLL_INTERVAL'])
+            self._wake.clear()
+            self.drain()
+
+    def backoff(self):
+        if not self.failures:
+            return 0
+        return min(self.app.config['OUTBOX_RETRY_BACKOFF'] * 2 ** (self.failures - 1),
+                   self.app.config['OUTBOX_MAX_BACKOFF'])
+
+    def drain(self):
+        """Publish batches until the outbox is empty or Pusher fails."""
+        with self.app.app_context():
+            try:
+                while self.publish_batch():
+                    pass
+            except Exception:
+                logger.exception('Outbox publisher failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def publish_batch(self):
+        """Publish one batch of events. Returns True when there may be more to send."""
+        batch_size = self.app.config['OUTBOX_BATCH_SIZE']
+        events = (OutboxEvent.query
+                  .filter(OutboxEvent.failed_at.is_(None))
+                  .order_by(OutboxEvent.id)
+                  .limit(batch_size)
+                  .with_for_update(skip_locked=True)
+                  .all())
+        if not events:
+            db.session.commit()
+            return False
+
+        send, superseded = coalesce(events)
+        for outbox_event in superseded:
+            db.session.delete(outbox_event)
+        for i in range(0, len(send), PUSHER_BATCH_LIMIT):
+            chunk = send[i:i + PUSHER_BATCH_LIMIT]
+            try:
+                self.send(chunk)
+            except REJECTED:
+                logger.warning('Pusher rejected a batch of %d outbox events, sending them one by one', len(chunk))
+                sent = self.send_each(chunk)
+            except Exception:
+                logger.exception('Failed to send %d outbox events', len(chunk))
+                self.retry_later(chunk)
+                sent = False
+            else:
+                for outbox_event in chunk:
+                    db.session.delete(outbox_event)
+                sent = True
+            if not sent:
+                db.session.commit()
+                self.failures += 1
+                return False
+        db.session.commit()
+        self.failures = 0
+        return len(events) == batch_size
+
+    def send(self, events):
+        with timed('pusher'):
+            self.client.trigger_batch([{'channel': e.channel, 'name': e.event, 'data': e.data} for e in events])
+
+    def send_each(self, events):
+        """Send ``events`` one at a time, failing the ones Pusher rejects.
+
+        Returns False if Pusher could not be reached; the events not sent yet are retried later.
+        """
+        for i, outbox_event in enumerate(events):
+            try:
+                self.send([outbox_event])
+            except REJECTED:
+                logger.exception('Pusher rejected outbox event %d, giving up on it', outbox_event.id)
+                self.fail(outbox_event)
+                continue
+            except Exception:
+                logger.exception('Failed to send outbox event %d', outbox_event.id)
+                self.retry_later(events[i:])
+                return False
+            db.session.delete(outbox_event)
+        return True
+
+    def retry_later(self, events):
+        for outbox_event in events:
+            outbox_event.attempts = (outbox_event.attempts or 0) + 1
+            if outbox_event.attempts >= self.app.config['OUTBOX_MAX_ATTEMPTS']:
+                logger.error('Outbox event %d failed %d times, giving up on it', outbox_event.id, outbox_event.attempts)
+                self.fail(outbox_event)
+
+    def fail(self, outbox_event):
+        outbox_event.failed_at = datetime.utcnow()
+
+    def retry_failed(self):
+        """Queue every failed event again; returns how many there were."""
+        with self.app.app_context():
+            count = (OutboxEvent.query
+                     .filter(OutboxEvent.failed_at.isnot(None))
+                     .update({'failed_at': None, 'attempts': 0}, synchronize_session=False))
+            db.session.commit()
+            db.session.remove()
+        self.notify()
+        return count
+
+
+publisher = OutboxPublisher(app, make_pusher_client(app.config))
+
+
+@event.listens_for(db.session, 'after_flush')
+def outbox_written(session, flush_context):
+    if any(isinstance(instance, OutboxEvent) for instance in session.new):
+        session.info['outbox_pending'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def outbox_committed(session):
+    if session.info.pop('outbox_pending', False):
+        publisher.notify()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def outbox_rolled_back(session):
+    session.info.pop('outbox_pending', None)
@@ -0,0 +1,96 @@
+from flask import request, url_for
+from sqlalchemy import DateTime, and_, or_
+
+from datetime import datetime
+import base64
+import json
+
+from .main import app
+
+CURSOR_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    values = [v.strftime(CURSOR_TIME_FORMAT) if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor produced by ``encode_cursor`` for the given sort columns."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if len(values) != len(columns):
+            raise ValueError
+        return [datetime.strptime(v, CURSOR_TIME_FORMAT) if v is not None and isinstance(c.type, DateTime) else v
+                for c, v in zip(columns, values)]
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def decode_offset(cursor):
+    """Decode an ``encode_cursor([offset])`` cursor, for orders that have no sort key to seek on."""
+    if not cursor:
+        return 0
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+            raise ValueError
+        return values[0]
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def page_limit(args):
+    """Read the ``limit`` query argument, clamped to the configured maximum."""
+    limit = args.get('limit', app.config['PAGE_SIZE'])
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, app.config['MAX_PAGE_SIZE'])
+
+
+def after(columns, values):
+    """Build ``(c1, c2, ...) > (v1, v2, ...)`` without relying on row value support."""
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column > value
+    return or_(column > value, and_(column == value, after(columns[1:], values[1:])))
+
+
+def seek(query, columns, cursor=None):
+    """Order ``query`` by ``columns``, starting after ``cursor`` when one is given."""
+    if cursor is not None:
+        query = query.filter(after(columns, cursor))
+    return query.order_by(*columns)
+
+
+def paginate(query, columns, cursor=None, limit=None):
+    """Return one page of ``query`` ordered by ``columns`` and the cursor of the next page.
+
+    Pages are selected with a keyset predicate on the sort columns rather than an
+    OFFSET, so every page costs the same index range scan.
+    """
+    rows = seek(query, columns, cursor).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in columns])
+    return rows, next_cursor
+
+
+def paginated(response, next_cursor):
+    """Attach the next page cursor to a response as ``X-Next-Cursor`` and a ``Link`` header."""
+    if next_cursor:
+        args = request.args.to_dict()
+        args.update(request.view_args or {})
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = '<{}>; rel="next"'.format(url_for(request.endpoint, _external=True, **args))
+    return response
+
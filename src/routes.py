@@ -1,58 +1,286 @@
-from flask import request, jsonify, Blueprint, make_response, render_template, url_for
+from flask import request, jsonify, Blueprint, Response, make_response, render_template, url_for, g
 from datetime import datetime, timedelta
-from functools import wraps
+import heapq
+import itertools
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
 import jwt
+import uuid
 from flask_mail import Message
-import pusher
 
-from .main import app, mail
-from .models import User, UserSchema, Job, JobSchema
+from .main import app, db
+from .mailer import mail_queue
+from .auth import auth_required, credential_cache, token_cache
+from .idempotency import idempotent
+from .models import User, UserSchema, Job, JobSchema, ArchivedJob, OutboxEvent, TableVersion
+from .conditional import conditional, conditional_row
+from .pagination import decode_cursor, decode_offset, encode_cursor, page_limit, paginate, paginated, seek
+from .streaming import stream, wants_stream
+from .serializers import dump_job, dump_job_row, dump_user, job_rows, json_response
+from .broker import broker, track_job, JobSnapshot
+from .dispatch import area_key, dispatch_index
+from .schedule import job_interval, schedule_index, stored_schedules
+from . import search, stats
 
 job_schema = JobSchema()
-jobs_schema = JobSchema(many=True)
-
 user_schema = UserSchema()
-users_schema = UserSchema(many=True)
 
 api = Blueprint('', __name__)
 
-channels_client = pusher.Pusher(
-  app_id='885511',
-  key='eb76090e47a74e0751c0',
-  secret='b87d7bb0cc422930140f',
-  cluster='eu',
-  ssl=True
-)
-
-# Auth decorators
-def auth_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'x-access-token' in request.headers:
-            token = request.headers['x-access-token']
-        if token:
-            try:
-                data = jwt.decode(token, app.config['SECRET_KEY'])
-            except:
-                return jsonify({'Error': 'Token is invalid'}), 401
-        elif request.authorization:
-            auth = request.authorization
-            user = User.query.filter_by(username=auth.username).first()
-            if not user:
-                return jsonify({'Error': 'Token is missing'}), 401
-            if not user.check_password(auth.password):
-                return jsonify({'Error': 'Invalid auth credentials'}), 401
-            if not user.confirmed:
-                return jsonify({'Error': 'User not confirmed'}), 401
+
+# Job events
+def broadcast(event, data, key=None):
+    """Queue a job-channel event; it is published once the current transaction commits."""
+    return OutboxEvent.enqueue('job-channel', event, data, key=key)
+
+
+# Query string filters
+def parse_bool(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'Invalid boolean: {value}')
+
+def parse_time(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+    except ValueError:
+        raise ValueError(f'Invalid time: {value}')
+
+def filter_jobs(query, args):
+    """Apply the ``GET /job`` query string filters to a job query."""
+    if 'is_complete' in args:
+        query = query.filter(Job.is_complete == parse_bool(args['is_complete']))
+    if 'driver' in args:
+        if args['driver'].lower() == 'none':
+            query = query.filter(Job._driver_id.is_(None))
+        else:
+            query = query.join(Job.driver).filter(User.public_id == args['driver'])
+    if 'pickup_from' in args:
+        query = query.filter(Job._pickup_time >= parse_time(args['pickup_from']))
+    if 'pickup_to' in args:
+        query = query.filter(Job._pickup_time < parse_time(args['pickup_to']))
+    if 'postcode' in args:
+        postcode = args['postcode'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Job.pickup_postcode.like(postcode + '%', escape='\\'))
+    return query
+
+JOB_FIELDS = {'number_of_people': int, 'name': str, 'contact_number': str, 'time_allowed': int, 'price': int}
+ADDRESS_FIELDS = ('house', 'road', 'village', 'postcode')
+USER_PATCH_FIELDS = {'username': str, 'email': str, 'password': str}
+SCHEDULE_FIELDS = {'driver_id', 'driver', 'pickup_time', 'time_allowed', 'is_complete'}
+# Public ids per 'new-jobs' event, which keeps each event well under Pusher's 10KB data limit
+NEW_JOBS_PER_EVENT = 200
+
+def fits(column, value):
+    """True when a string ``value`` fits the length of ``jobs`` column ``column``."""
+    return len(value) <= Job.__table__.c[column].type.length
+
+def check_time_allowed(item):
+    """Reject a ``time_allowed`` that is not a positive number of minutes.
+
+    A job without one would never overlap another, so the schedule check could not see it.
+    """
+    value = item.get('time_allowed')
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+        raise ValueError('Invalid time_allowed')
+
+def job_row(item):
+    """Validate one job from a bulk import and convert it to ``jobs`` column values.
+
+    Every value is checked here, so a bad job is reported on its own instead of failing
+    the INSERT of the whole batch.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Job must be an object')
+    check_time_allowed(item)
+    row = {}
+    for field, field_type in JOB_FIELDS.items():
+        if field in item:
+            value = item[field]
+            if not isinstance(value, field_type) or (field_type is str and not fits(field, value)):
+                raise ValueError(f'Invalid {field}')
+            row[field] = value
+    if 'pickup_time' in item:
+        if not isinstance(item['pickup_time'], str):
+            raise ValueError('Invalid pickup_time')
+        row['_pickup_time'] = parse_time(item['pickup_time'])
+    for prefix in ('pickup', 'dropoff'):
+        address = item.get(f'{prefix}_address')
+        if address is None:
+            continue
+        if not isinstance(address, dict) or any(not isinstance(address.get(field), str) or
+                                                not fits(f'{prefix}_{field}', address[field])
+                                                for field in ADDRESS_FIELDS):
+            raise ValueError(f'Invalid {prefix}_address')
+        for field in ADDRESS_FIELDS:
+            row[f'{prefix}_{field}'] = address[field]
+    row['public_id'] = str(uuid.uuid4())
+    return row
+
+def job_patch(item):
+    """Validate a ``PATCH /job/<id>`` body and convert it to ``Job`` attribute values."""
+    if not isinstance(item, dict):
+        raise ValueError('Expected an object')
+    check_time_allowed(item)
+    patch = {}
+    for field, value in item.items():
+        if field in JOB_FIELDS:
+            if not isinstance(value, JOB_FIELDS[field]):
+                raise ValueError(f'Invalid {field}')
+            patch[field] = value
+        elif field == 'is_complete':
+            if not isinstance(value, bool):
+                raise ValueError('Invalid is_complete')
+            patch[field] = value
+        elif field == 'pickup_time':
+            parse_time(value if isinstance(value, str) else '')
+            patch[field] = value
+        elif field in ('pickup_address', 'dropoff_address'):
+            if not isinstance(value, dict) or any(not isinstance(value.get(key), str) for key in ADDRESS_FIELDS):
+                raise ValueError(f'Invalid {field}')
+            patch[field] = {key: value[key] for key in ADDRESS_FIELDS}
+        elif field == 'driver_id':
+            if value is None:
+                patch['driver'] = None
+            elif not isinstance(value, str) or not User.get_by_public_id(value):
+                raise ValueError(f'Unknown driver: {value}')
+            else:
+                patch[field] = value
         else:
-            return jsonify({'Error': 'Token is missing'}), 401
-        return f(*args, **kwargs)
-    return decorated
+            raise ValueError(f'Unknown field: {field}')
+    return patch
+
+def user_patch(item):
+    """Validate a ``PATCH /user/<id>`` body."""
+    if not isinstance(item, dict):
+        raise ValueError('Expected an object')
+    for field, value in item.items():
+        if field not in USER_PATCH_FIELDS:
+            raise ValueError(f'Unknown field: {field}')
+        if not isinstance(value, USER_PATCH_FIELDS[field]):
+            raise ValueError(f'Invalid {field}')
+    return item
+
+def job_slot(job):
+    """Return the ``(driver_id, start, end)`` that ``job`` holds its driver for, or None."""
+    # Reading job.driver must not flush the pending change before it has been checked
+    with db.session.no_autoflush:
+        if job.driver is None or job.is_complete or job._pickup_time is None:
+            return None
+        return (job.driver.id,) + job_interval(job._pickup_time, job.time_allowed)
+
+def schedule_conflicts(job):
+    """Pre-check ``job`` against the schedule index; returns the overlapping public ids."""
+    slot = job_slot(job)
+    if slot is None:
+        return []
+    return schedule_index.conflicts(*slot, exclude=job.public_id)
+
+def stored_conflicts(job):
+    """Check ``job`` against the database once it has been saved in this transaction."""
+    slot = job_slot(job)
+    if slot is None:
+        return []
+    driver_id, start, end = slot
+    return [public_id for _, public_id, _ in stored_schedules([driver_id], start, end).get(driver_id, ())
+            if public_id != job.public_id]
+
+def without_stored_conflicts(rows, positions, errors):
+    """Drop the bulk ``rows`` whose driver is busy, per the database or an earlier row.
+
+    Call after bumping the jobs version, as for ``stored_schedules``. Dropped rows are
+    reported in ``errors`` against their index in the request, from ``positions``.
+    """
+    assigned = [row for row in rows if row.get('_driver_id') is not None and not row.get('is_complete')]
+    if not assigned:
+        return rows
+    intervals = {id(row): job_interval(row['_pickup_time'], row.get('time_allowed')) for row in assigned}
+    schedules = stored_schedules({row['_driver_id'] for row in assigned},
+                                 min(start for start, _ in intervals.values()),
+                                 max(end for _, end in intervals.values()))
+    kept = []
+    for row in rows:
+        if id(row) in intervals:
+            start, end = intervals[id(row)]
+            entries = schedules.setdefault(row['_driver_id'], [])
+            conflicts = [public_id for entry_start, public_id, entry_end in entries
+                         if entry_start < end and entry_end > start]
+            if conflicts:
+                errors.append({'index': positions[id(row)],
+                               'Error': f"Driver already has a job at that time: {', '.join(conflicts)}"})
+                continue
+            entries.append((start, row['public_id'], end))
+        kept.append(row)
+    return kept
+
+def conflict_response(conflicts):
+    return jsonify({'Error': 'Driver already has a job at that time', 'conflicts': conflicts}), 409
+
+def job_listing(query):
+    """Prepare a job query for listing; returns the query and the function that dumps its rows."""
+    if app.config['FAST_SERIALIZERS']:
+        return job_rows(query), dump_job_row
+    return query.options(joinedload(Job.driver)), job_schema.dump
+
+def nulls_last():
+    """True when the database sorts NULLs after other values in ascending order."""
+    return db.engine.dialect.name == 'postgresql'
+
+def merged_job_key(row, archived, nulls_last):
+    """Sort key of a live or archived job, in ``JOB_ORDER`` with NULLs where the database puts them.
+
+    Archived jobs keep the ids they had in ``jobs``, and SQLite can hand a deleted job's id
+    to a new job, so a live and an archived job with the same key are told apart by
+    putting the live one first.
+    """
+    missing = row._pickup_time is None
+    return (missing if nulls_last else not missing, row._pickup_time or datetime.min, row.id, archived)
+
+def after_job(model, cursor, archived):
+    """Filter ``model`` rows, live or archived, to those after a ``GET /user/<id>/jobs`` cursor."""
+    pickup_time, job_id, cursor_archived = cursor
+    # An archived job with the cursor's id and pickup time comes after a live one
+    later_id = model.id >= job_id if archived and not cursor_archived else model.id > job_id
+    if pickup_time is None:
+        later = and_(model._pickup_time.is_(None), later_id)
+        return later if nulls_last() else or_(model._pickup_time.isnot(None), later)
+    later = or_(model._pickup_time > pickup_time, and_(model._pickup_time == pickup_time, later_id))
+    return or_(later, model._pickup_time.is_(None)) if nulls_last() else later
+
+def with_archived(rows, archived):
+    """Merge a driver's live job ``rows`` with their ``archived`` jobs, both in pickup order.
+
+    Yields ``(row, is_archived)`` pairs.
+    """
+    if hasattr(rows, 'yield_per'):
+        batch_size = app.config['STREAM_BATCH_SIZE']
+        rows, archived = rows.yield_per(batch_size), archived.yield_per(batch_size)
+    order = nulls_last()
+    return heapq.merge(((row, False) for row in rows), ((row, True) for row in archived),
+                       key=lambda item: merged_job_key(item[0], item[1], order))
+
+def decode_user_jobs_cursor(cursor):
+    """Decode the ``[pickup_time, id, archived]`` cursor of ``GET /user/<id>/jobs``."""
+    values = decode_cursor(cursor, JOB_ORDER + (ArchivedJob.id,))
+    if values is not None and (not isinstance(values[1], int) or values[2] not in (0, 1)):
+        raise ValueError('Invalid cursor')
+    return values
+
+def archived_response():
+    return jsonify({'Error': 'Job is archived'}), 409
+
+def user_dumper():
+    return dump_user if app.config['FAST_SERIALIZERS'] else user_schema.dump
+
+JOB_ORDER = (Job._pickup_time, Job.id)
+USER_ORDER = (User.id,)
 
 
 # Create User
 @api.route('/user', methods=['POST'])
+@idempotent
 def create_user():
     json = request.json
     if 'username' not in json.keys():
@@ -82,7 +310,7 @@ def create_user():
             html = render_template('confirm_email.html', 
                 confirm_url=confirm_url),   
                 sender='system@CBTaxis.com')
-        mail.send(msg)
+        mail_queue.send(msg)
 
     return user_schema.jsonify(user)
 
@@ -90,6 +318,7 @@ def create_user():
 # Get User
 @api.route('/user/<id>', methods=['GET'])
 @auth_required
+@conditional_row(User)
 def get_user(id):
     user = User.get_by_public_id(id)
     if user:
@@ -99,9 +328,18 @@ def get_user(id):
 # Get Users
 @api.route('/user', methods=['GET'])
 @auth_required
+@conditional('users')
 def get_users():
-    all_users = User.query.all()
-    return jsonify(users_schema.dump(all_users))
+    try:
+        cursor = decode_cursor(request.args.get('cursor'), USER_ORDER)
+        limit = page_limit(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    dump = user_dumper()
+    if wants_stream():
+        return stream(seek(User.query, USER_ORDER, cursor), dump)
+    users, next_cursor = paginate(User.query, USER_ORDER, cursor, limit)
+    return paginated(json_response([dump(user) for user in users]), next_cursor)
 
 # Update User
 @api.route('/user/<id>', methods=['PUT'])
@@ -109,17 +347,44 @@ def get_users():
 def update_user(id):
     user = User.get_by_public_id(id)
     if user:
+        if 'password' in request.json or 'username' in request.json:
+            credential_cache.invalidate(user.username)
         user.update(**request.json)
         return jsonify({'Success': "User has been modified"}), 200
     else:
         return jsonify({'Error': "User not found"}), 405
 
+# Patch User
+@api.route('/user/<id>', methods=['PATCH'])
+@auth_required
+def patch_user(id):
+    user = User.get_by_public_id(id)
+    if not user:
+        return jsonify({'Error': "User not found"}), 405
+    try:
+        patch = user_patch(request.json)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    # bcrypt salts every hash, so an unchanged password would always look changed
+    if 'password' in patch and user.check_password(patch['password']):
+        patch = {field: value for field, value in patch.items() if field != 'password'}
+    username = user.username
+    changed = user.patch(commit=False, **patch)
+    if not changed:
+        return jsonify({'changed': [], 'version': user.version}), 200
+    db.session.commit()
+    if 'username' in changed or 'password' in changed:
+        credential_cache.invalidate(username)
+    return jsonify({'changed': sorted(changed), 'version': user.version}), 200
+
 # Delete User
 @api.route('/user/<id>', methods=['DELETE'])
 @auth_required
 def delete_user(id):
     user = User.get_by_public_id(id)
     if user:
+        credential_cache.invalidate(user.username)
+        token_cache.invalidate(user.public_id)
         user.delete()
         return jsonify({'Success': "User has been deleted"}), 200
     else:
@@ -128,20 +393,100 @@ def delete_user(id):
 # Get particular Users Jobs
 @api.route('/user/<id>/jobs', methods=['GET'])
 @auth_required
+@conditional('jobs', 'users')
 def get_user_jobs(id):
+    if g.principal.public_id == id and g.principal.user_id is not None:
+        user_id = g.principal.user_id
+    else:
+        user = User.get_by_public_id(id)
+        if not user:
+            return jsonify({'Error': "User not found"}), 405
+        user_id = user.id
+    try:
+        cursor = decode_user_jobs_cursor(request.args.get('cursor'))
+        limit = page_limit(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    live = Job.query.filter(Job._driver_id == user_id)
+    archived = ArchivedJob.for_driver(user_id)
+    if cursor is not None:
+        live = live.filter(after_job(Job, cursor, archived=False))
+        archived = archived.filter(after_job(ArchivedJob, cursor, archived=True))
+    query, dump = job_listing(live.order_by(*JOB_ORDER))
+    dump_archived = dump_job if app.config['FAST_SERIALIZERS'] else job_schema.dump
+
+    def dump_merged(item):
+        row, is_archived = item
+        return dump_archived(row) if is_archived else dump(row)
+
+    if wants_stream():
+        return stream(with_archived(query, archived), dump_merged)
+    jobs = list(itertools.islice(with_archived(query.limit(limit + 1), archived.limit(limit + 1)), limit + 1))
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        row, is_archived = jobs[-1]
+        next_cursor = encode_cursor([row._pickup_time, row.id, int(is_archived)])
+    return paginated(json_response([dump_merged(item) for item in jobs]), next_cursor)
+
+
+# Get User Schedule
+@api.route('/user/<id>/schedule', methods=['GET'])
+@auth_required
+def get_user_schedule(id):
     user = User.get_by_public_id(id)
-    if user:
-        jobs = jobs_schema.dump(user.jobs)
-        return jsonify(jobs)
+    if not user:
+        return jsonify({'Error': "User not found"}), 405
+    try:
+        start = parse_time(request.args['pickup_from']) if 'pickup_from' in request.args else None
+        end = parse_time(request.args['pickup_to']) if 'pickup_to' in request.args else None
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    if start is not None or end is not None:
+        entries = schedule_index.overlapping(user.id, start or datetime.min, end or datetime.max)
     else:
+        entries = schedule_index.schedule(user.id)
+    return jsonify([{'public_id': public_id, 'start': interval_start.isoformat(), 'end': interval_end.isoformat()}
+                    for interval_start, public_id, interval_end in entries])
+
+# Get User Stats
+@api.route('/user/<id>/stats', methods=['GET'])
+@auth_required
+def get_user_stats(id):
+    user = User.get_by_public_id(id)
+    if not user:
         return jsonify({'Error': "User not found"}), 405
+    period = request.args.get('period', 'day')
+    try:
+        if period not in ('day', 'week', 'month'):
+            raise ValueError(f'Invalid period: {period}')
+        start, end = stats.report_range(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    report = stats.driver_report(user.id, start, end, period)
+    return jsonify(dict(report, driver=user.public_id, period=period, **{'from': start.isoformat(), 'to': end.isoformat()}))
 
+# Get Driver Stats
+@api.route('/stats/drivers', methods=['GET'])
+@auth_required
+def get_driver_stats():
+    try:
+        start, end = stats.report_range(request.args)
+        limit = page_limit(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    return jsonify(stats.drivers_report(start, end, limit))
 
 # Create Job
 @app.route('/job', methods=['POST'])
 @auth_required
+@idempotent
 def create_job():
     json = request.json
+    try:
+        check_time_allowed(json)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
     params = {}
 
     if 'number_of_people' in json.keys():
@@ -161,15 +506,83 @@ def create_job():
     if 'dropoff_address' in json.keys():
         params['dropoff_address'] = json['dropoff_address']
         
-    new_job = Job.create(**params)
+    new_job = Job(**params)
     if 'driver_id' in json.keys():
-        new_job.update(driver_id=json['driver_id'])
-    channels_client.trigger('job-channel', 'new-job', job_schema.dump(new_job))
+        new_job.driver_id = json['driver_id']
+    conflicts = schedule_conflicts(new_job)
+    if conflicts:
+        return conflict_response(conflicts)
+    new_job.save(commit=False)
+    db.session.flush()
+    conflicts = stored_conflicts(new_job)
+    if conflicts:
+        db.session.rollback()
+        return conflict_response(conflicts)
+    broadcast('new-job', job_schema.dump(new_job), key=new_job.public_id)
+    db.session.commit()
     return job_schema.jsonify(new_job)
 
+# Bulk Create Jobs
+@api.route('/job/bulk', methods=['POST'])
+@auth_required
+@idempotent
+def create_jobs():
+    items = request.json
+    if not isinstance(items, list):
+        return jsonify({'Error': 'Expected a list of jobs'}), 400
+    if len(items) > app.config['BULK_MAX_JOBS']:
+        return jsonify({'Error': f"At most {app.config['BULK_MAX_JOBS']} jobs per request"}), 400
+
+    driver_ids = {item['driver_id'] for item in items
+                  if isinstance(item, dict) and isinstance(item.get('driver_id'), str)}
+    drivers = {}
+    if driver_ids:
+        drivers = dict(db.session.query(User.public_id, User.id).filter(User.public_id.in_(driver_ids)))
+
+    rows, errors, positions = [], [], {}
+    for index, item in enumerate(items):
+        try:
+            row = job_row(item)
+            if item.get('driver_id') is not None:
+                if not isinstance(item['driver_id'], str) or item['driver_id'] not in drivers:
+                    raise ValueError(f"Unknown driver: {item['driver_id']}")
+                row['_driver_id'] = drivers[item['driver_id']]
+                if '_pickup_time' in row:
+                    start, end = job_interval(row['_pickup_time'], row.get('time_allowed'))
+                    conflicts = schedule_index.conflicts(row['_driver_id'], start, end)
+                    if conflicts:
+                        raise ValueError(f"Driver already has a job at that time: {', '.join(conflicts)}")
+        except ValueError as e:
+            errors.append({'index': index, 'Error': str(e)})
+            continue
+        rows.append(row)
+        positions[id(row)] = index
+
+    if rows:
+        last_seq = TableVersion.bump('jobs', by=len(rows))
+        now = datetime.utcnow()
+        for row in rows:
+            row['updated_at'] = now
+            row.setdefault('_pickup_time', now)
+        rows = without_stored_conflicts(rows, positions, errors)
+        for seq, row in enumerate(rows, last_seq - len(rows) + 1):
+            row['change_seq'] = seq
+    created = [row['public_id'] for row in rows]
+    if rows:
+        db.session.bulk_insert_mappings(Job, rows)
+        for row in rows:
+            track_job(db.session, row['public_id'], JobSnapshot(row))
+        stats.record_rows(rows)
+        for i in range(0, len(created), NEW_JOBS_PER_EVENT):
+            broadcast('new-jobs', {'public_ids': created[i:i + NEW_JOBS_PER_EVENT]})
+        db.session.commit()
+    errors.sort(key=lambda error: error['index'])
+    return jsonify({'created': created, 'errors': errors}), 200 if created or not errors else 400
+
 # Get Job
 @api.route('/job/<id>', methods=['GET'])
 @auth_required
+@conditional_row(Job, 'users')
 def get_job(id):
     job = Job.get_by_public_id(id)
     if job:
@@ -179,31 +592,175 @@ def get_job(id):
 # Get Jobs
 @api.route('/job', methods=['GET'])
 @auth_required
+@conditional('jobs', 'users')
 def get_jobs():
-    all_jobs = Job.query.all()
-    return jsonify(jobs_schema.dump(all_jobs))
+    try:
+        query = filter_jobs(Job.query, request.args)
+        cursor = decode_cursor(request.args.get('cursor'), JOB_ORDER)
+        limit = page_limit(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    query, dump = job_listing(query)
+    if wants_stream():
+        return stream(seek(query, JOB_ORDER, cursor), dump)
+    jobs, next_cursor = paginate(query, JOB_ORDER, cursor, limit)
+    return paginated(json_response([dump(job) for job in jobs]), next_cursor)
+
+# Dispatch Open Jobs
+@api.route('/job/dispatch', methods=['GET'])
+@auth_required
+def dispatch_jobs():
+    try:
+        if 'area' not in request.args:
+            raise ValueError('area is required')
+        area = area_key(request.args['area'])
+        start = parse_time(request.args['pickup_from']) if 'pickup_from' in request.args else datetime.utcnow()
+        if 'pickup_to' in request.args:
+            end = parse_time(request.args['pickup_to'])
+        else:
+            end = start + timedelta(minutes=app.config['DISPATCH_WINDOW_MINUTES'])
+        limit = page_limit(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    public_ids = dispatch_index.lookup(area, start, end, limit)
+    if not public_ids:
+        return json_response([])
+    # The index trails other processes' commits by one broker poll, so recheck that the jobs are still open
+    query = (Job.query
+             .filter(Job.public_id.in_(public_ids), Job.is_complete.is_(False), Job._driver_id.is_(None))
+             .order_by(*JOB_ORDER))
+    query, dump = job_listing(query)
+    return json_response([dump(job) for job in query])
+
+# Search Jobs
+@api.route('/job/search', methods=['GET'])
+@auth_required
+def search_jobs():
+    try:
+        terms = search.search_terms(request.args.get('q', ''))
+        if not terms:
+            raise ValueError('q is required')
+        offset = decode_offset(request.args.get('cursor'))
+        limit = page_limit(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    # Results are in relevance order, which has no key to seek on, so pages use an offset
+    ids = search.search_jobs(terms, offset, limit + 1)
+    next_cursor = encode_cursor([offset + limit]) if len(ids) > limit else None
+    ids = ids[:limit]
+    if not ids:
+        return json_response([])
+    query, dump = job_listing(Job.query.filter(Job.id.in_(ids)))
+    rank = {job_id: i for i, job_id in enumerate(ids)}
+    jobs = sorted(query, key=lambda job: rank[job.id])
+    return paginated(json_response([dump(job) for job in jobs]), next_cursor)
+
+# Get Job Changes
+@api.route('/job/changes', methods=['GET'])
+@auth_required
+def get_job_changes():
+    try:
+        since = int(request.args.get('since', 0))
+        limit = page_limit(request.args)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    changes = [{'op': 'upsert', 'seq': seq, 'job': job_schema.dump(job)} if job else
+               {'op': 'delete', 'seq': seq, 'public_id': public_id}
+               for seq, job, public_id in Job.changes(since, limit)]
+    return jsonify({
+        'changes': changes,
+        'cursor': str(changes[-1]['seq'] if changes else since),
+        'more': len(changes) == limit,
+    })
+
+# Job Event Stream
+@api.route('/job/stream', methods=['GET'])
+@auth_required
+def job_stream():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    subscription = broker.subscribe(last_event_id)
+    if subscription is None:
+        return jsonify({'Error': 'Job stream is not available, try again later'}), 503, {'Retry-After': '5'}
+    heartbeat = app.config['SSE_HEARTBEAT']
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            yield from subscription.messages(heartbeat)
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # Update Job
 @api.route('/job/<id>', methods=['PUT'])
 @auth_required
 def update_job(id):
     job = Job.get_by_public_id(id)
+    if job and job.archived:
+        return archived_response()
     if job:
-        job.update(**request.json)
-        channels_client.trigger('job-channel', 'updated-job', job_schema.jsonify(job))
+        try:
+            check_time_allowed(request.json)
+        except ValueError as e:
+            return jsonify({'Error': str(e)}), 400
+        job.update(commit=False, **request.json)
+        conflicts = schedule_conflicts(job) or stored_conflicts(job)
+        if conflicts:
+            db.session.rollback()
+            return conflict_response(conflicts)
+        broadcast('updated-job', job_schema.dump(job), key=job.public_id)
+        db.session.commit()
         return jsonify({'Success': "Job has been modified"}), 200
     
     else:
         return jsonify({'Error': "Job not found"}), 406
 
+# Patch Job
+@api.route('/job/<id>', methods=['PATCH'])
+@auth_required
+def patch_job(id):
+    job = Job.get_by_public_id(id)
+    if not job:
+        return jsonify({'Error': "Job not found"}), 406
+    if job.archived:
+        return archived_response()
+    try:
+        patch = job_patch(request.json)
+    except ValueError as e:
+        return jsonify({'Error': str(e)}), 400
+    changed = job.patch(commit=False, **patch)
+    if not changed:
+        return jsonify({'changed': [], 'version': job.version}), 200
+    if SCHEDULE_FIELDS.intersection(changed):
+        conflicts = schedule_conflicts(job) or stored_conflicts(job)
+        if conflicts:
+            db.session.rollback()
+            return conflict_response(conflicts)
+    db.session.flush()
+    dumped = job_schema.dump(job)
+    fields = {'driver' if field == 'driver_id' else field for field in changed}
+    broadcast('patched-job', {'public_id': job.public_id, 'version': job.version,
+                              'changes': {field: dumped[field] for field in fields}}, key=job.public_id)
+    db.session.commit()
+    return jsonify({'changed': sorted(fields), 'version': job.version}), 200
+
 # Delete Job
 @api.route('/job/<id>', methods=['DELETE'])
 @auth_required
 def delete_job(id):
     job = Job.get_by_public_id(id)
+    if job and job.archived:
+        return archived_response()
     if job:
-        job.delete()
-        channels_client.trigger('job-channel', 'deleted-job', {'public_id': id})
+        job.delete(commit=False)
+        broadcast('deleted-job', {'public_id': id}, key=id)
+        db.session.commit()
         return jsonify({'Success': "Job has been deleted"}), 200
     else:
         return jsonify({'Error': "Job not found"}), 406
@@ -220,7 +777,7 @@ def login():
     if not user:
         return make_response('Could not verify', 401, {'WWW-Authenticate' : 'Basic realm="Login required'})
 
-    if not user.verify(auth.password):
+    if not user.confirmed or not credential_cache.check(user, auth.password):
         return make_response('Could not verify', 401, {'WWW-Authenticate' : 'Basic realm="Login required'})
     else:
         token = jwt.encode({'public_id': user.public_id,
@@ -0,0 +1,122 @@
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from .main import app, db
+from .models import Job
+from .broker import broker, JobIndex
+
+
+DEFAULT_TIME_ALLOWED = Job.__table__.c.time_allowed.default.arg
+
+
+def job_interval(pickup_time, time_allowed):
+    """The time a job holds its driver: ``[pickup_time, pickup_time + time_allowed minutes)``."""
+    if time_allowed is None:
+        time_allowed = DEFAULT_TIME_ALLOWED
+    return pickup_time, pickup_time + timedelta(minutes=time_allowed)
+
+
+def stored_schedules(driver_ids, start, end):
+    """Return ``{driver_id: [(start, public_id, end)]}`` for the open jobs of ``driver_ids``
+    that overlap ``[start, end)``, read from the database.
+
+    The index is only a pre-check, since it trails writes by other processes. This is
+    the authoritative check: run it after ``TableVersion.bump('jobs')`` in the same
+    transaction, as ``save`` does, and the counter row lock keeps any other job write
+    from committing between the check and the caller's commit.
+    """
+    open_jobs = (Job._driver_id.in_(driver_ids), Job.is_complete.is_(False), Job._pickup_time.isnot(None))
+    longest = db.session.query(db.func.max(Job.time_allowed)).filter(*open_jobs).scalar()
+    longest = timedelta(minutes=max(longest or 0, DEFAULT_TIME_ALLOWED))
+    earliest = start - longest if start - datetime.min > longest else datetime.min
+    rows = (db.session.query(Job._driver_id, Job.public_id, Job._pickup_time, Job.time_allowed)
+            .filter(*open_jobs, Job._pickup_time > earliest, Job._pickup_time < end))
+    schedules = {}
+    for driver_id, public_id, pickup_time, time_allowed in rows:
+        job_start, job_end = job_interval(pickup_time, time_allowed)
+        if job_end > start:
+            schedules.setdefault(driver_id, []).append((job_start, public_id, job_end))
+    return schedules
+
+
+class ScheduleIndex(JobIndex):
+    """Assigned, incomplete jobs as intervals per driver.
+
+    Each driver has a list of ``(start, public_id, end)`` sorted by start, and the length
+    of the longest interval it has held. Overlap checks bisect to the earliest start that
+    could still reach the window, so they cost O(log n) plus the overlapping intervals.
+    """
+    def clear(self):
+        self.drivers = {}
+        self.longest = {}
+        self.jobs = {}
+
+    def load(self):
+        query = (db.session.query(Job.public_id, Job._driver_id, Job._pickup_time, Job.time_allowed)
+                 .filter(Job._driver_id.isnot(None), Job.is_complete.is_(False), Job._pickup_time.isnot(None))
+                 .order_by(Job._driver_id, Job._pickup_time)
+                 .yield_per(app.config['STREAM_BATCH_SIZE']))
+        for public_id, driver_id, pickup_time, time_allowed in query:
+            self.add(public_id, driver_id, pickup_time, time_allowed, append=True)
+        for entries in self.drivers.values():
+            entries.sort()
+
+    def apply(self, job, public_id):
+        self.remove(job.public_id if job is not None else public_id)
+        if job is not None and job._driver_id is not None and not job.is_complete and job._pickup_time is not None:
+            self.add(job.public_id, job._driver_id, job._pickup_time, job.time_allowed)
+
+    def add(self, public_id, driver_id, pickup_time, time_allowed, append=False):
+        start, end = job_interval(pickup_time, time_allowed)
+        entry = (start, public_id, end)
+        self.jobs[public_id] = (driver_id, entry)
+        self.longest[driver_id] = max(self.longest.get(driver_id, timedelta(0)), end - start)
+        entries = self.drivers.setdefault(driver_id, [])
+        if append:
+            entries.append(entry)
+        else:
+            insort(entries, entry)
+
+    def remove(self, public_id):
+        found = self.jobs.pop(public_id, None)
+        if found is None:
+            return
+        driver_id, entry = found
+        entries = self.drivers[driver_id]
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+        if not entries:
+            del self.drivers[driver_id]
+            del self.longest[driver_id]
+
+    def overlapping(self, driver_id, start, end):
+        """Return the ``(start, public_id, end)`` intervals of a driver that overlap ``[start, end)``."""
+        self.ensure()
+        with self._lock:
+            entries = self.drivers.get(driver_id)
+            if not entries:
+                return []
+            longest = self.longest[driver_id]
+            earliest = start - longest if start - datetime.min > longest else datetime.min
+            found = []
+            for i in range(bisect_left(entries, (earliest,)), len(entries)):
+                entry = entries[i]
+                if entry[0] >= end:
+                    break
+                if entry[2] > start:
+                    found.append(entry)
+            return found
+
+    def conflicts(self, driver_id, start, end, exclude=None):
+        """Return the public ids of a driver's jobs that overlap ``[start, end)``, other than ``exclude``."""
+        return [public_id for _, public_id, _ in self.overlapping(driver_id, start, end) if public_id != exclude]
+
+    def schedule(self, driver_id):
+        """Return every interval of a driver, in order of start."""
+        self.ensure()
+        with self._lock:
+            return list(self.drivers.get(driver_id, ()))
+
+
+schedule_index = ScheduleIndex(broker)
@@ -0,0 +1,102 @@
+from sqlalchemy import event, text, DDL
+
+import re
+
+from .main import db
+from .models import Job
+
+TERM = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+
+# Must match the expression of the ix_jobs_search index exactly, or Postgres won't use it
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(contact_number, '') || ' ' || "
+    "replace(coalesce(contact_number, ''), ' ', '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(pickup_road, '') || ' ' || coalesce(pickup_village, '') || ' ' || "
+    "coalesce(pickup_postcode, '') || ' ' || replace(coalesce(pickup_postcode, ''), ' ', '') || ' ' || "
+    "coalesce(dropoff_road, '') || ' ' || coalesce(dropoff_village, '') || ' ' || "
+    "coalesce(dropoff_postcode, '') || ' ' || replace(coalesce(dropoff_postcode, ''), ' ', '')), 'B')"
+)
+
+# Column weights for bm25 over jobs_fts (name, contact, address)
+SQLITE_RANK = 'bm25(jobs_fts, 10.0, 10.0, 1.0)'
+
+# The jobs_fts columns of a ``jobs`` row, with ``{row}`` naming the row
+FTS_VALUES = (
+    "{row}.name, "
+    "coalesce({row}.contact_number, '') || ' ' || replace(coalesce({row}.contact_number, ''), ' ', ''), "
+    "coalesce({row}.pickup_road, '') || ' ' || coalesce({row}.pickup_village, '') || ' ' || "
+    "coalesce({row}.pickup_postcode, '') || ' ' || replace(coalesce({row}.pickup_postcode, ''), ' ', '') || ' ' || "
+    "coalesce({row}.dropoff_road, '') || ' ' || coalesce({row}.dropoff_village, '') || ' ' || "
+    "coalesce({row}.dropoff_postcode, '') || ' ' || replace(coalesce({row}.dropoff_postcode, ''), ' ', '')"
+)
+SEARCHED_COLUMNS = ('name, contact_number, pickup_road, pickup_village, pickup_postcode, '
+                    'dropoff_road, dropoff_village, dropoff_postcode')
+
+FTS_INSERT = f'INSERT INTO jobs_fts (rowid, name, contact, address) VALUES (new.id, {FTS_VALUES.format(row="new")}); '
+FTS_FILL = f'INSERT INTO jobs_fts (rowid, name, contact, address) SELECT jobs.id, {FTS_VALUES.format(row="jobs")} FROM jobs'
+
+SQLITE_INDEX = (
+    "CREATE VIRTUAL TABLE jobs_fts USING fts5(name, contact, address, tokenize = 'unicode61 remove_diacritics 2')",
+    f'CREATE TRIGGER jobs_fts_insert AFTER INSERT ON jobs BEGIN {FTS_INSERT}END',
+    'CREATE TRIGGER jobs_fts_delete AFTER DELETE ON jobs BEGIN DELETE FROM jobs_fts WHERE rowid = old.id; END',
+    f'CREATE TRIGGER jobs_fts_update AFTER UPDATE OF {SEARCHED_COLUMNS} ON jobs BEGIN '
+    f'DELETE FROM jobs_fts WHERE rowid = old.id; {FTS_INSERT}END',
+)
+POSTGRES_INDEX = f'CREATE INDEX ix_jobs_search ON jobs USING gin (({SEARCH_DOCUMENT}))'
+
+# Databases made by ``db.create_all`` rather than the migrations get the index too
+for statement in SQLITE_INDEX:
+    event.listen(Job.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Job.__table__, 'after_create', DDL(POSTGRES_INDEX).execute_if(dialect='postgresql'))
+event.listen(Job.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS jobs_fts').execute_if(dialect='sqlite'))
+
+
+def search_terms(q):
+    """Split a search string into at most ``MAX_TERMS`` lower-case words."""
+    return TERM.findall(q.lower())[:MAX_TERMS]
+
+
+def search_jobs(terms, offset, limit):
+    """Return the ids of the jobs matching every term as a prefix, best match first.
+
+    Uses the ``jobs_fts`` FTS5 table on SQLite and the ``ix_jobs_search`` tsvector index
+    on PostgreSQL; both are created with the ``jobs`` table, by ``db.create_all`` or a
+    migration, and follow every write to ``jobs``.
+    """
+    params = {'limit': limit, 'offset': offset}
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        params['query'] = ' '.join(f'"{term}"*' for term in terms)
+        statement = text(f'SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH :query '
+                         f'ORDER BY {SQLITE_RANK}, rowid LIMIT :limit OFFSET :offset')
+    elif dialect == 'postgresql':
+        params['query'] = ' & '.join(f'{term}:*' for term in terms)
+        statement = text(f"SELECT id FROM jobs WHERE {SEARCH_DOCUMENT} @@ to_tsquery('simple', :query) "
+                         f"ORDER BY ts_rank({SEARCH_DOCUMENT}, to_tsquery('simple', :query)) DESC, id "
+                         f"LIMIT :limit OFFSET :offset")
+    else:
+        return unindexed_search(terms, offset, limit)
+    return [job_id for job_id, in db.session.execute(statement, params)]
+
+
+def unindexed_search(terms, offset, limit):
+    """Prefix search with LIKE for databases without a text index; scans ``jobs``."""
+    columns = [Job.name, Job.contact_number, Job.pickup_road, Job.pickup_village, Job.pickup_postcode,
+               Job.dropoff_road, Job.dropoff_village, Job.dropoff_postcode]
+    query = db.session.query(Job.id)
+    for term in terms:
+        pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(db.or_(*[db.func.lower(column).like(pattern, escape='\\') for column in columns]))
+    return [job_id for job_id, in query.order_by(Job.id).offset(offset).limit(limit)]
+
+
+def rebuild():
+    """Rebuild the search index from ``jobs``, e.g. after restoring a backup."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(text('DELETE FROM jobs_fts'))
+        db.session.execute(text(FTS_FILL))
+    elif dialect == 'postgresql':
+        db.session.execute(text('REINDEX INDEX ix_jobs_search'))
+    db.session.commit()
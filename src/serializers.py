@@ -0,0 +1,162 @@
+from flask import current_app, json
+from marshmallow import fields
+from sqlalchemy.orm import aliased
+
+from datetime import date
+
+from .models import User, Job, JobSchema, UserSchema
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def inferred(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def scalar(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+def nested(dump, many):
+    if many:
+        return lambda value: None if value is None else [dump(v) for v in value]
+    return lambda value: None if value is None else dump(value)
+
+
+def formatter(field):
+    """Return a plain function equivalent to ``field``'s serialization, or None if there isn't one."""
+    if isinstance(field, fields.Nested):
+        return nested(compile_schema(field.schema), field.many)
+    if isinstance(field, fields.DateTime) and field.format in (None, 'iso'):
+        return isoformat
+    if type(field).__name__ == 'Inferred':
+        return inferred
+    if isinstance(field, fields.String):
+        return scalar(str)
+    if isinstance(field, fields.Integer):
+        return scalar(int)
+    if isinstance(field, fields.Boolean):
+        return scalar(bool)
+    if type(field) is fields.Raw:
+        return lambda value: value
+    return None
+
+
+def compile_schema(schema):
+    """Compile ``schema`` into a function that dumps one object to a dict.
+
+    The field list is resolved once and turned into a single dict display, so dumping an
+    object costs one attribute read and at most one call per field. Fields without a plain
+    equivalent fall back to the marshmallow field itself.
+    """
+    namespace = {}
+    items = []
+    schema_fields = getattr(schema, 'dump_fields', None) or schema.fields
+    for i, (name, field) in enumerate(schema_fields.items()):
+        key = getattr(field, 'data_key', None) or name
+        attribute = field.attribute or name
+        format_value = formatter(field)
+        if format_value is None or not attribute.isidentifier():
+            namespace[f'field{i}'] = field
+            items.append(f'{key!r}: field{i}.serialize({name!r}, obj)')
+        else:
+            namespace[f'format{i}'] = format_value
+            items.append(f'{key!r}: format{i}(obj.{attribute})')
+    source = 'def dump(obj):\n    return {' + ', '.join(items) + '}\n'
+    exec(source, namespace)
+    return namespace['dump']
+
+
+class JobRow:
+    """Adapts a row from ``job_rows`` to the attributes ``JobSchema`` reads from a ``Job``."""
+    __slots__ = ('row', 'driver')
+
+    def __init__(self, row):
+        self.row = row
+        self.driver = DriverRow(row) if row.driver_pk is not None else None
+
+    def __getattr__(self, name):
+        return getattr(self.row, name)
+
+    @property
+    def pickup_time(self):
+        return self.row._pickup_time
+
+    @property
+    def pickup_address(self):
+        row = self.row
+        return {'house': row.pickup_house, 'road': row.pickup_road,
+                'village': row.pickup_village, 'postcode': row.pickup_postcode}
+
+    @property
+    def dropoff_address(self):
+        row = self.row
+        return {'house': row.dropoff_house, 'road': row.dropoff_road,
+                'village': row.dropoff_village, 'postcode': row.dropoff_postcode}
+
+
+class DriverRow:
+    __slots__ = ('username', 'avatar_hash', 'last_active', 'public_id')
+
+    def __init__(self, row):
+        self.username = row.driver_username
+        self.avatar_hash = row.driver_avatar_hash
+        self.last_active = row.driver_last_active
+        self.public_id = row.driver_public_id
+
+
+def job_rows(query):
+    """Turn a ``Job`` query into a plain column query with the driver columns joined in.
+
+    No ``Job`` or ``User`` instances are built for the rows. Ordering and filters on the
+    query are kept, so the result can still be paginated on ``(_pickup_time, id)``.
+    """
+    driver = aliased(User)
+    columns = [c for c in Job.__table__.columns]
+    return (query
+            .outerjoin(driver, Job._driver_id == driver.id)
+            .with_entities(*[getattr(Job, c.key) for c in columns],
+                           driver.id.label('driver_pk'),
+                           driver.public_id.label('driver_public_id'),
+                           driver.username.label('driver_username'),
+                           driver.avatar_hash.label('driver_avatar_hash'),
+                           driver.last_active.label('driver_last_active')))
+
+
+dump_job = compile_schema(JobSchema())
+dump_user = compile_schema(UserSchema())
+
+
+def dump_job_row(row):
+    return dump_job(JobRow(row))
+
+
+def dumps(data):
+    """Encode ``data`` exactly as ``jsonify`` would, using orjson when that gives the same bytes.
+
+    orjson is only used outside pretty-printing mode, with sorted keys, and only when the
+    result is pure ASCII, since ``jsonify`` escapes non-ASCII characters.
+    """
+    config = current_app.config
+    if (orjson is not None and config['FAST_JSON'] and config['JSON_SORT_KEYS']
+            and not (config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug)):
+        encoded = orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        try:
+            return encoded.decode('ascii')
+        except UnicodeDecodeError:
+            pass
+    if config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug:
+        return json.dumps(data, indent=2, separators=(', ', ': ')) + '\n'
+    return json.dumps(data, indent=None, separators=(',', ':')) + '\n'
+
+
+def json_response(data):
+    """Build a JSON response byte-compatible with ``jsonify(data)``."""
+    return current_app.response_class(dumps(data), mimetype=current_app.config['JSONIFY_MIMETYPE'])
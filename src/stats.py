@@ -0,0 +1,178 @@
+from sqlalchemy import event, inspect
+from datetime import date, datetime, timedelta
+
+from .main import db
+from .models import User, Job, ArchivedJob, DriverStats, TableVersion
+
+STATS_FIELDS = ('jobs', 'completed_jobs', 'revenue', 'passengers')
+JOB_STATS_ATTRIBUTES = ('_driver_id', '_pickup_time', 'is_complete', 'price', 'number_of_people')
+
+
+def contribution(driver_id, pickup_time, is_complete, price, number_of_people):
+    """Return the ``((driver_id, day), totals)`` a job adds to ``driver_stats``, or None."""
+    if driver_id is None or pickup_time is None:
+        return None
+    if is_complete:
+        return (driver_id, pickup_time.date()), (1, 1, price or 0, max(number_of_people or 0, 0))
+    return (driver_id, pickup_time.date()), (1, 0, 0, 0)
+
+
+def add(deltas, found, sign=1):
+    if found is None:
+        return
+    key, values = found
+    totals = deltas.setdefault(key, [0] * len(STATS_FIELDS))
+    for i, value in enumerate(values):
+        totals[i] += sign * value
+
+
+def current(job):
+    return contribution(*(getattr(job, attribute) for attribute in JOB_STATS_ATTRIBUTES))
+
+
+def previous(job):
+    """The contribution of ``job`` as it was loaded, before this flush changed it."""
+    state = inspect(job)
+    values = []
+    for attribute in JOB_STATS_ATTRIBUTES:
+        history = state.attrs[attribute].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        else:
+            values.append(history.unchanged[0] if history.unchanged else None)
+    return contribution(*values)
+
+
+def apply(deltas, session=None):
+    """Add ``{(driver_id, day): totals}`` to ``driver_stats``, creating rows as needed."""
+    session = session or db.session
+    table = DriverStats.__table__
+    for (driver_id, day), values in deltas.items():
+        if not any(values):
+            continue
+        where = (table.c.driver_id == driver_id) & (table.c.day == day)
+        result = session.execute(table.update().where(where).values(
+            {table.c[field]: table.c[field] + value for field, value in zip(STATS_FIELDS, values)}))
+        if result.rowcount == 0:
+            session.execute(table.insert().values(driver_id=driver_id, day=day, **dict(zip(STATS_FIELDS, values))))
+
+
+def record_rows(rows):
+    """Count jobs written with bulk inserts, which bypass the flush listener."""
+    deltas = {}
+    for row in rows:
+        add(deltas, contribution(row.get('_driver_id'), row.get('_pickup_time'), row.get('is_complete'),
+                                 row.get('price'), row.get('number_of_people')))
+    apply(deltas)
+
+
+@event.listens_for(db.session, 'after_flush')
+def job_stats_flushed(session, flush_context):
+    deltas = {}
+    for job in session.new:
+        if isinstance(job, Job):
+            add(deltas, current(job))
+    for job in session.dirty:
+        if isinstance(job, Job) and session.is_modified(job):
+            add(deltas, previous(job), -1)
+            add(deltas, current(job))
+    for job in session.deleted:
+        if isinstance(job, Job):
+            add(deltas, previous(job), -1)
+    if deltas:
+        # Rows of drivers deleted in this flush are removed by the foreign key cascade
+        deleted_users = {user.id for user in session.deleted if isinstance(user, User)}
+        apply({key: values for key, values in deltas.items() if key[0] not in deleted_users}, session)
+
+
+def load_old_values(target, value, oldvalue, initiator):
+    pass
+
+
+# Load the old value of these attributes before they are replaced, so the flush listener
+# can always subtract what a job used to count for
+for attribute in JOB_STATS_ATTRIBUTES:
+    event.listen(getattr(Job, attribute), 'set', load_old_values, active_history=True)
+
+
+def per_job(table):
+    """One row per assigned job in ``table`` with what it adds to its driver's day."""
+    c = table.c
+    completed = c.is_complete.is_(True)
+    return (db.select([c._driver_id.label('driver_id'),
+                       db.func.date(c._pickup_time).label('day'),
+                       db.case([(completed, 1)], else_=0).label('completed_jobs'),
+                       db.case([(completed, db.func.coalesce(c.price, 0))], else_=0).label('revenue'),
+                       db.case([(completed & (c.number_of_people > 0), c.number_of_people)], else_=0)
+                       .label('passengers')])
+            .where(c._driver_id.isnot(None) & c._pickup_time.isnot(None)))
+
+
+def rebuild():
+    """Recompute ``driver_stats`` from ``jobs`` and ``jobs_archive``; returns the row count.
+
+    The ``jobs`` change counter is locked first, so job writes wait for the rebuild to
+    commit instead of being counted twice or lost.
+    """
+    TableVersion.bump('jobs')
+    jobs = db.union_all(per_job(Job.__table__), per_job(ArchivedJob.__table__)).alias('jobs')
+    totals = (db.select([jobs.c.driver_id, jobs.c.day, db.func.count().label('jobs'),
+                         db.func.sum(jobs.c.completed_jobs), db.func.sum(jobs.c.revenue),
+                         db.func.sum(jobs.c.passengers)])
+              .group_by(jobs.c.driver_id, jobs.c.day))
+    db.session.execute(DriverStats.__table__.delete())
+    db.session.execute(DriverStats.__table__.insert().from_select(['driver_id', 'day'] + list(STATS_FIELDS), totals))
+    count = db.session.query(DriverStats).count()
+    db.session.commit()
+    return count
+
+
+def period_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+
+
+def report_range(args):
+    """The ``from``/``to`` dates of a report, by default the current month so far."""
+    today = date.today()
+    start = parse_day(args['from']) if 'from' in args else today.replace(day=1)
+    end = parse_day(args['to']) if 'to' in args else today
+    return start, end
+
+
+def driver_report(driver_id, start, end, period):
+    """Totals of one driver between ``start`` and ``end`` inclusive, split by ``period``."""
+    rows = (db.session.query(DriverStats)
+            .filter(DriverStats.driver_id == driver_id, DriverStats.day >= start, DriverStats.day <= end)
+            .order_by(DriverStats.day))
+    periods, totals = {}, dict.fromkeys(STATS_FIELDS, 0)
+    for row in rows:
+        key = period_start(row.day, period).isoformat()
+        bucket = periods.setdefault(key, dict.fromkeys(STATS_FIELDS, 0))
+        for field in STATS_FIELDS:
+            bucket[field] += getattr(row, field)
+            totals[field] += getattr(row, field)
+    return {'totals': totals, 'periods': [dict(bucket, period=key) for key, bucket in periods.items()]}
+
+
+def drivers_report(start, end, limit):
+    """Totals per driver between ``start`` and ``end`` inclusive, highest revenue first."""
+    sums = [db.func.sum(getattr(DriverStats, field)).label(field) for field in STATS_FIELDS]
+    rows = (db.session.query(User.public_id, User.username, *sums)
+            .select_from(DriverStats)
+            .join(User, User.id == DriverStats.driver_id)
+            .filter(DriverStats.day >= start, DriverStats.day <= end)
+            .group_by(User.public_id, User.username)
+            .order_by(db.desc('revenue'), User.public_id)
+            .limit(limit))
+    return [dict(zip(('driver', 'username') + STATS_FIELDS, row)) for row in rows]
@@ -0,0 +1,47 @@
+from flask import Response, request, stream_with_context, json
+
+from .main import app
+
+NDJSON = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def wants_stream():
+    """True when the client asked for a streamed listing, with ``?stream=1`` or NDJSON."""
+    return request.args.get('stream', '').lower() in ('1', 'true') or wants_ndjson()
+
+
+def stream(query, dump):
+    """Stream the rows of ``query``, each converted by ``dump``, as a JSON array or NDJSON.
+
+    Rows are fetched ``STREAM_BATCH_SIZE`` at a time with ``yield_per`` and each batch is
+    encoded and sent before the next one is loaded, so memory use does not grow with the
+    number of rows. ``query`` may also be any iterable of rows.
+    """
+    ndjson = wants_ndjson()
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    def generate():
+        chunk = []
+        separator = '\n' if ndjson else ','
+        if not ndjson:
+            yield '['
+        rows = query.yield_per(batch_size) if hasattr(query, 'yield_per') else query
+        for i, row in enumerate(rows):
+            if i and not ndjson:
+                chunk.append(separator)
+            chunk.append(json.dumps(dump(row)))
+            if ndjson:
+                chunk.append(separator)
+            if len(chunk) >= batch_size:
+                yield ''.join(chunk)
+                chunk = []
+        if not ndjson:
+            chunk.append(']\n')
+        if chunk:
+            yield ''.join(chunk)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON if ndjson else 'application/json')
@@ -0,0 +1,77 @@
+import os
+
+os.environ['env'] = 'src.config.Testing'
+
+from base64 import b64encode
+from datetime import datetime, timedelta
+import uuid
+
+import pytest
+
+from src.main import app as flask_app, db, bcrypt
+from src.models import User, Job
+from src.auth import credential_cache, token_cache
+from src.broker import broker
+from src import loader
+
+USERNAME = 'tester'
+PASSWORD = 'secret'
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+    broker.reset()
+    credential_cache.cache.clear()
+    token_cache.cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(app):
+    """Basic auth headers of a confirmed user."""
+    with app.app_context():
+        user = {'username': USERNAME, 'email': f'{USERNAME}@example.com', 'confirmed': True}
+        loader.load(User, loader.imported_users([user], bcrypt.generate_password_hash(PASSWORD)))
+    credentials = b64encode(f'{USERNAME}:{PASSWORD}'.encode('utf-8')).decode('ascii')
+    return {'Authorization': f'Basic {credentials}'}
+
+
+@pytest.fixture
+def make_drivers(app):
+    """Create ``count`` confirmed drivers; returns their ``(id, public_id)`` pairs."""
+    def make(count):
+        with app.app_context():
+            start = loader.next_user_number()
+            rows = list(loader.synthetic_users(count, b'unused', start=start))
+            loader.load(User, rows)
+            public_ids = [row['public_id'] for row in rows]
+            return (db.session.query(User.id, User.public_id)
+                    .filter(User.public_id.in_(public_ids)).order_by(User.id).all())
+    return make
+
+
+@pytest.fixture
+def make_jobs(app):
+    """Create one assigned, open job for each of ``drivers``; returns their public ids."""
+    def make(drivers, start=datetime(2019, 10, 23, 9, 0)):
+        rows = [{'public_id': str(uuid.uuid4()), 'name': f'Customer {i}', 'contact_number': '01223 000000',
+                 'number_of_people': 2, 'price': 1000 + i, 'is_complete': False,
+                 '_pickup_time': start + timedelta(hours=i), '_driver_id': driver_id,
+                 'pickup_house': '1', 'pickup_road': 'Mill Road', 'pickup_village': 'Cambridge',
+                 'pickup_postcode': 'CB1 2AB', 'dropoff_house': '2', 'dropoff_road': 'Hills Road',
+                 'dropoff_village': 'Cambridge', 'dropoff_postcode': 'CB2 1CD'}
+                for i, (driver_id, _) in enumerate(drivers)]
+        with app.app_context():
+            loader.load(Job, rows)
+        return [row['public_id'] for row in rows]
+    return make
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import uuid
+
+import pytest
+
+from src.archive import archive_completed
+from src.main import db
+from src.models import Job, ArchivedJob
+from src.routes import nulls_last
+from src import loader
+
+START = datetime(2019, 10, 23, 9, 0)
+
+
+def job(driver_id, pickup_time, is_complete):
+    return {'public_id': str(uuid.uuid4()), 'name': 'Customer', '_driver_id': driver_id,
+            '_pickup_time': pickup_time, 'is_complete': is_complete}
+
+
+@pytest.fixture
+def driver_jobs(app, make_drivers):
+    """A driver with six jobs an hour apart, every other one complete and archived.
+
+    Returns the driver's public id and the public ids of the jobs in pickup order.
+    """
+    (driver_id, driver), = make_drivers(1)
+    rows = [job(driver_id, START + timedelta(hours=i), i % 2 == 0) for i in range(6)]
+    with app.app_context():
+        loader.load(Job, rows)
+        assert archive_completed(datetime.utcnow(), batch_size=2) == 3
+    return driver, [row['public_id'] for row in rows]
+
+
+def pages(client, auth, path, limit):
+    public_ids, cursor = [], None
+    while True:
+        response = client.get(path, query_string=dict(limit=limit, **({'cursor': cursor} if cursor else {})),
+                              headers=auth)
+        assert response.status_code == 200
+        public_ids += [job['public_id'] for job in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return public_ids
+
+
+def test_archive_moves_completed_jobs_in_batches(app, driver_jobs):
+    _, public_ids = driver_jobs
+    with app.app_context():
+        assert [job.public_id for job in Job.query.order_by(Job._pickup_time)] == public_ids[1::2]
+        archived = ArchivedJob.query.order_by(ArchivedJob._pickup_time).all()
+        assert [job.public_id for job in archived] == public_ids[::2]
+        assert all(job.is_complete and job.archived_at for job in archived)
+        assert archive_completed(datetime.utcnow()) == 0
+
+
+def test_user_jobs_include_archived_jobs(client, auth, driver_jobs):
+    driver, public_ids = driver_jobs
+    response = client.get(f'/user/{driver}/jobs', headers=auth)
+    assert [job['public_id'] for job in response.get_json()] == public_ids
+
+
+@pytest.mark.parametrize('limit', [1, 2, 4])
+def test_user_jobs_paginate_across_the_archive(client, auth, driver_jobs, limit):
+    driver, public_ids = driver_jobs
+    assert pages(client, auth, f'/user/{driver}/jobs', limit) == public_ids
+
+
+def test_user_jobs_pages_keep_ties_and_missing_pickup_times(app, client, auth, driver_jobs):
+    driver, public_ids = driver_jobs
+    with app.app_context():
+        driver_id = Job.query.filter_by(public_id=public_ids[1]).one()._driver_id
+        # Archiving the newest job lets SQLite give its id to the next one
+        last = job(driver_id, START + timedelta(hours=6), True)
+        loader.load(Job, [last])
+        assert archive_completed(datetime.utcnow()) == 1
+        tie = job(driver_id, last['_pickup_time'], False)
+        missing = job(driver_id, None, False)
+        loader.load(Job, [tie, missing])
+        tie_id = Job.query.filter_by(public_id=tie['public_id']).one().id
+        last_id = ArchivedJob.query.filter_by(public_id=last['public_id']).one().id
+        if db.engine.dialect.name == 'sqlite':
+            assert tie_id == last_id
+    # Equal pickup times are ordered by id, and a live job comes before an archived one
+    ties = sorted([(tie_id, False, tie['public_id']), (last_id, True, last['public_id'])])
+    expected = public_ids + [public_id for _, _, public_id in ties]
+    if nulls_last():
+        expected.append(missing['public_id'])
+    else:
+        expected.insert(0, missing['public_id'])
+    for limit in (1, 3):
+        assert pages(client, auth, f'/user/{driver}/jobs', limit) == expected
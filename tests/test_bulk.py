@@ -0,0 +1,30 @@
+import json
+
+from src.outbox import PUSHER_DATA_LIMIT
+from src.models import OutboxEvent
+
+
+def test_new_jobs_events_fit_in_a_pusher_event(app, client, auth):
+    response = client.post('/job/bulk', json=[{'name': f'Customer {i}'} for i in range(1000)], headers=auth)
+    assert response.status_code == 200
+    created = response.get_json()['created']
+    with app.app_context():
+        events = OutboxEvent.query.filter_by(event='new-jobs').order_by(OutboxEvent.id).all()
+        assert [public_id for e in events for public_id in e.data['public_ids']] == created
+        assert all(len(json.dumps(e.data)) <= PUSHER_DATA_LIMIT for e in events)
+
+
+def test_bad_jobs_are_reported_per_item(client, auth):
+    address = {'house': '1', 'road': 'Mill Road', 'village': 'Cambridge', 'postcode': 'CB1 2AB'}
+    items = [
+        {'name': 'Good', 'pickup_address': address},
+        {'name': 'Numeric time', 'pickup_time': 5},
+        {'name': 'Numeric road', 'pickup_address': dict(address, road=5)},
+        {'name': 'Long road', 'dropoff_address': dict(address, road='x' * 65)},
+        {'name': 'x' * 65},
+    ]
+    response = client.post('/job/bulk', json=items, headers=auth)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['created']) == 1
+    assert [error['index'] for error in body['errors']] == [1, 2, 3, 4]
@@ -0,0 +1,69 @@
+import threading
+
+from src.models import Job, OutboxEvent, IdempotencyKey
+from src.idempotency import idempotency_store
+
+
+def post_job(client, auth, key, name='Customer'):
+    return client.post('/job', json={'name': name}, headers=dict(auth, **{'Idempotency-Key': key}))
+
+
+def test_retry_replays_the_first_response(app, client, auth):
+    first = post_job(client, auth, 'retry')
+    second = post_job(client, auth, 'retry')
+    assert first.status_code == second.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert 'Idempotent-Replayed' not in first.headers
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    with app.app_context():
+        assert Job.query.count() == 1
+        assert OutboxEvent.query.filter_by(event='new-job').count() == 1
+
+
+def test_replayed_headers_are_not_repeated(client, auth):
+    first = post_job(client, auth, 'headers')
+    second = post_job(client, auth, 'headers')
+    for name in ('Content-Type', 'Content-Length'):
+        assert second.headers.getlist(name) == first.headers.getlist(name)
+        assert len(second.headers.getlist(name)) == 1
+
+
+def test_key_reused_with_a_different_body(app, client, auth):
+    assert post_job(client, auth, 'reused').status_code == 200
+    assert post_job(client, auth, 'reused', name='Someone else').status_code == 422
+    with app.app_context():
+        assert Job.query.count() == 1
+
+
+def test_concurrent_duplicates_create_one_job(app, auth):
+    barrier = threading.Barrier(4)
+    responses = []
+
+    def send():
+        client = app.test_client()
+        barrier.wait()
+        responses.append(post_job(client, auth, 'concurrent'))
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.get_json()['public_id'] for response in responses}) == 1
+    assert sum('Idempotent-Replayed' in response.headers for response in responses) == 3
+    with app.app_context():
+        assert Job.query.count() == 1
+
+
+def test_server_errors_are_not_stored(app):
+    scope = ('create_job', '', 'flaky')
+    with app.test_request_context():
+        response = idempotency_store.respond(scope, 'body', lambda: ('Unavailable', 503))
+        assert response.status_code == 503
+        assert IdempotencyKey.query.count() == 0
+        response = idempotency_store.respond(scope, 'body', lambda: ('Created', 200))
+        assert response.status_code == 200
+        assert 'Idempotent-Replayed' not in response.headers
+        replayed = idempotency_store.respond(scope, 'body', lambda: ('Created again', 200))
+        assert replayed.get_data() == b'Created'
@@ -0,0 +1,20 @@
+from src.main import db
+from src.models import OutboxEvent
+from src.outbox import OutboxPublisher, StubPusher, PUSHER_DATA_LIMIT
+
+
+def test_rejected_event_does_not_block_later_events(app):
+    publisher = OutboxPublisher(app, StubPusher())
+    with app.app_context():
+        OutboxEvent.enqueue('job-channel', 'new-job', {'n': 1})
+        OutboxEvent.enqueue('job-channel', 'new-job', {'blob': 'x' * PUSHER_DATA_LIMIT})
+        OutboxEvent.enqueue('job-channel', 'new-job', {'n': 3})
+        db.session.commit()
+
+    publisher.drain()
+
+    assert [pusher_event['data'] for pusher_event in publisher.client.events] == [{'n': 1}, {'n': 3}]
+    with app.app_context():
+        remaining = OutboxEvent.query.all()
+        assert len(remaining) == 1
+        assert remaining[0].failed_at is not None
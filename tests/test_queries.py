@@ -0,0 +1,36 @@
+"""Listings run the same number of SQL statements however many jobs they return."""
+from flask import g
+
+import pytest
+
+
+def sql_count(client, path, headers):
+    """Request ``path`` and return the statements it ran, as counted by ``src.metrics``."""
+    with client:
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return g.sql_count
+
+
+@pytest.fixture(params=[True, False], ids=['fast', 'marshmallow'])
+def serializers(app, request, monkeypatch):
+    monkeypatch.setitem(app.config, 'FAST_SERIALIZERS', request.param)
+
+
+def test_get_jobs(client, auth, make_drivers, make_jobs, serializers):
+    drivers = make_drivers(50)
+    make_jobs(drivers[:1])
+    sql_count(client, '/job', auth)
+    one = sql_count(client, '/job', auth)
+    make_jobs(drivers[1:])
+    assert sql_count(client, '/job', auth) == one
+
+
+def test_get_user_jobs(client, auth, make_drivers, make_jobs, serializers):
+    driver = make_drivers(1)
+    path = f'/user/{driver[0].public_id}/jobs'
+    make_jobs(driver)
+    sql_count(client, path, auth)
+    one = sql_count(client, path, auth)
+    make_jobs(driver * 49)
+    assert sql_count(client, path, auth) == one
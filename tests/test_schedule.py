@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from src.models import User
+
+
+def job(driver_id, pickup_time, **fields):
+    return dict({'name': 'Customer', 'driver_id': driver_id, 'time_allowed': 30,
+                 'pickup_time': pickup_time.strftime('%Y-%m-%dT%H:%M:%S.%f')}, **fields)
+
+
+def test_overlapping_jobs_are_refused(client, auth, make_drivers):
+    (_, driver), = make_drivers(1)
+    start = datetime(2019, 10, 23, 9, 0)
+    statuses = [client.post('/job', json=job(driver, start + timedelta(minutes=i)), headers=auth).status_code
+                for i in range(30)]
+    assert statuses.count(200) == 1
+    assert statuses.count(409) == 29
+
+
+def test_overlapping_bulk_jobs_are_refused(client, auth, make_drivers):
+    (_, driver), = make_drivers(1)
+    start = datetime(2019, 10, 23, 9, 0)
+    assert client.post('/job', json=job(driver, start), headers=auth).status_code == 200
+    items = [job(driver, start + timedelta(minutes=10)), job(driver, start + timedelta(hours=1)),
+             job(driver, start + timedelta(hours=1, minutes=10))]
+    body = client.post('/job/bulk', json=items, headers=auth).get_json()
+    assert len(body['created']) == 1
+    assert [error['index'] for error in body['errors']] == [0, 2]
+
+
+def test_first_writes_are_saved(app, client, auth, make_drivers):
+    (driver_id, driver), = make_drivers(1)
+    with app.app_context():
+        username = User.query.get(driver_id).username
+    start = datetime(2019, 10, 23, 9, 0)
+    response = client.post('/job', json=job(driver, start), headers=auth)
+    assert response.status_code == 200
+    public_id = response.get_json()['public_id']
+
+    response = client.put(f'/job/{public_id}', json={'name': 'Renamed'}, headers=auth)
+    assert response.status_code == 200
+    saved = client.get(f'/job/{public_id}', headers=auth).get_json()
+    assert saved['name'] == 'Renamed'
+    assert saved['driver']['username'] == username
+
+
+def test_time_allowed_must_be_positive(client, auth, make_drivers):
+    (_, driver), = make_drivers(1)
+    start = datetime(2019, 10, 23, 9, 0)
+    for time_allowed in (0, -30):
+        assert client.post('/job', json=job(driver, start, time_allowed=time_allowed),
+                           headers=auth).status_code == 400
+    body = client.post('/job/bulk', json=[job(driver, start, time_allowed=0)], headers=auth).get_json()
+    assert body['created'] == [] and body['errors'][0]['Error'] == 'Invalid time_allowed'
+
+    public_id = client.post('/job', json=job(driver, start), headers=auth).get_json()['public_id']
+    assert client.put(f'/job/{public_id}', json={'time_allowed': 0}, headers=auth).status_code == 400
+    assert client.patch(f'/job/{public_id}', json={'time_allowed': -5}, headers=auth).status_code == 400
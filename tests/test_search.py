@@ -0,0 +1,8 @@
+def test_search_works_without_migrations(client, auth, make_drivers, make_jobs):
+    public_ids = make_jobs(make_drivers(3))
+    response = client.get('/job/search?q=customer', headers=auth)
+    assert response.status_code == 200
+    assert sorted(job['public_id'] for job in response.get_json()) == sorted(public_ids)
+
+    response = client.get('/job/search?q=cb12', headers=auth)
+    assert len(response.get_json()) == 3
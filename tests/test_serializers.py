@@ -0,0 +1,78 @@
+"""The compiled serializers produce exactly what ``jsonify`` of ``JobSchema`` and ``UserSchema`` produce."""
+from datetime import datetime, timedelta
+
+from flask import jsonify
+import pytest
+
+from src.archive import archive_completed
+from src.models import User, UserSchema, Job, JobSchema, ArchivedJob
+from src.serializers import dump_job, dump_job_row, dump_user, job_rows, json_response
+from src import loader
+
+
+def expected(jobs):
+    return jsonify(JobSchema(many=True).dump(jobs)).get_data()
+
+
+@pytest.fixture
+def jobs(app, make_drivers):
+    drivers = make_drivers(2)
+    start = datetime(2019, 10, 23, 17, 58, 27, 825593)
+    address = {'house': '1', 'road': 'Mill Road', 'village': 'Cambridge', 'postcode': 'CB1 2AB'}
+    rows = [
+        dict(name='Zoë Brontë', number_of_people=3, price=1250, is_complete=True, _driver_id=drivers[0].id,
+             _pickup_time=start, **{f'pickup_{k}': v for k, v in address.items()},
+             **{f'dropoff_{k}': v for k, v in address.items()}),
+        dict(name='Unassigned', is_complete=False, _pickup_time=start + timedelta(hours=1)),
+        dict(contact_number='01223 000000', is_complete=True, _driver_id=drivers[1].id,
+             _pickup_time=start + timedelta(hours=2), pickup_postcode='CB2 1CD'),
+    ]
+    with app.app_context():
+        loader.load(Job, rows)
+
+
+def test_live_jobs(app, jobs):
+    with app.test_request_context():
+        live = Job.query.order_by(Job.id).all()
+        assert json_response([dump_job(job) for job in live]).get_data() == expected(live)
+
+
+def test_job_rows(app, jobs):
+    with app.test_request_context():
+        live = Job.query.order_by(Job.id).all()
+        rows = job_rows(Job.query.order_by(Job.id)).all()
+        assert json_response([dump_job_row(row) for row in rows]).get_data() == expected(live)
+
+
+def test_archived_jobs(app, jobs):
+    with app.test_request_context():
+        assert archive_completed(datetime.utcnow()) == 2
+        archived = ArchivedJob.query.order_by(ArchivedJob.id).all()
+        assert json_response([dump_job(job) for job in archived]).get_data() == expected(archived)
+
+
+@pytest.fixture
+def users(app, jobs):
+    rows = [
+        {'username': 'Zoë', 'email': 'zoe@example.com', 'avatar_hash': 'abc123', 'confirmed': False,
+         'last_active': datetime(2019, 10, 23, 8, 0, 0, 12)},
+        {'username': 'anonymous', 'email': None, 'avatar_hash': None, 'confirmed': None, 'last_active': None},
+    ]
+    with app.app_context():
+        loader.load(User, rows)
+
+
+def test_users(app, users):
+    with app.test_request_context():
+        users = User.query.order_by(User.id).all()
+        assert any(not user.jobs for user in users) and any(user.jobs for user in users)
+        expected = jsonify(UserSchema(many=True).dump(users)).get_data()
+        assert json_response([dump_user(user) for user in users]).get_data() == expected
+
+
+def test_user_listing(app, client, auth, users, monkeypatch):
+    bodies = []
+    for fast in (True, False):
+        monkeypatch.setitem(app.config, 'FAST_SERIALIZERS', fast)
+        bodies.append(client.get('/user', headers=auth).get_data())
+    assert bodies[0] == bodies[1]
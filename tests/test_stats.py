@@ -0,0 +1,86 @@
+"""The incrementally kept ``driver_stats`` counters always match a full ``rebuild``."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.archive import archive_completed
+from src.models import DriverStats
+from src import stats
+
+START = datetime(2019, 10, 23, 9, 0)
+
+
+def pickup(offset):
+    return (START + offset).strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+
+def counters():
+    """The non-empty ``driver_stats`` rows; deleting a day's last job leaves a row of zeros."""
+    rows = DriverStats.query.order_by(DriverStats.driver_id, DriverStats.day)
+    totals = [(row.driver_id, row.day) + tuple(getattr(row, field) for field in stats.STATS_FIELDS) for row in rows]
+    return [row for row in totals if any(row[2:])]
+
+
+def assert_matches_rebuild(app):
+    with app.app_context():
+        kept = counters()
+        stats.rebuild()
+        assert counters() == kept
+    return kept
+
+
+@pytest.fixture
+def drivers(make_drivers):
+    return make_drivers(2)
+
+
+@pytest.fixture
+def job(client, auth, drivers):
+    body = {'name': 'Customer', 'price': 1500, 'number_of_people': 3, 'pickup_time': pickup(timedelta(0)),
+            'driver_id': drivers[0].public_id}
+    response = client.post('/job', json=body, headers=auth)
+    assert response.status_code == 200
+    return response.get_json()['public_id']
+
+
+def test_create(app, drivers, job):
+    assert assert_matches_rebuild(app) == [(drivers[0].id, START.date(), 1, 0, 0, 0)]
+
+
+def test_complete_and_uncomplete(app, client, auth, drivers, job):
+    client.patch(f'/job/{job}', json={'is_complete': True}, headers=auth)
+    assert assert_matches_rebuild(app) == [(drivers[0].id, START.date(), 1, 1, 1500, 3)]
+    client.patch(f'/job/{job}', json={'is_complete': False}, headers=auth)
+    assert assert_matches_rebuild(app) == [(drivers[0].id, START.date(), 1, 0, 0, 0)]
+
+
+def test_reassign_and_unassign(app, client, auth, drivers, job):
+    client.patch(f'/job/{job}', json={'is_complete': True}, headers=auth)
+    client.patch(f'/job/{job}', json={'driver_id': drivers[1].public_id}, headers=auth)
+    assert assert_matches_rebuild(app) == [(drivers[1].id, START.date(), 1, 1, 1500, 3)]
+    client.patch(f'/job/{job}', json={'driver_id': None}, headers=auth)
+    assert assert_matches_rebuild(app) == []
+
+
+def test_put_moves_the_job_to_another_day(app, client, auth, drivers, job):
+    # PUT sets attributes that were expired by the previous commit, so their old values
+    # are only known because of the active_history listeners
+    body = {'is_complete': True, 'price': 2000, 'pickup_time': pickup(timedelta(days=1))}
+    assert client.put(f'/job/{job}', json=body, headers=auth).status_code == 200
+    assert assert_matches_rebuild(app) == [(drivers[0].id, START.date() + timedelta(days=1), 1, 1, 2000, 3)]
+
+
+def test_delete(app, client, auth, job):
+    assert client.delete(f'/job/{job}', headers=auth).status_code == 200
+    assert assert_matches_rebuild(app) == []
+
+
+def test_bulk_create_and_archive(app, client, auth, drivers, job):
+    items = [{'name': f'Customer {i}', 'price': 100, 'driver_id': drivers[1].public_id,
+              'pickup_time': pickup(timedelta(hours=i))} for i in range(3)]
+    assert len(client.post('/job/bulk', json=items, headers=auth).get_json()['created']) == 3
+    client.patch(f'/job/{job}', json={'is_complete': True}, headers=auth)
+    before = assert_matches_rebuild(app)
+    with app.app_context():
+        assert archive_completed(datetime.utcnow()) == 1
+    assert assert_matches_rebuild(app) == before
@@ -0,0 +1,13 @@
+from src.broker import broker
+
+
+def test_stream_is_unavailable_until_the_broker_is_ready(app, client, auth, monkeypatch):
+    def prime():
+        raise ConnectionError('database is unreachable')
+
+    monkeypatch.setitem(app.config, 'SSE_READY_TIMEOUT', 0.1)
+    monkeypatch.setattr(broker, 'prime', prime)
+    broker.reset()
+    response = client.get('/job/stream', headers=auth)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
@@ -0,0 +1,13 @@
+from src.models import User
+
+from .conftest import USERNAME, PASSWORD
+
+
+def test_patching_the_same_password_changes_nothing(app, client, auth):
+    with app.app_context():
+        public_id = User.query.filter_by(username=USERNAME).one().public_id
+    response = client.patch(f'/user/{public_id}', json={'password': PASSWORD}, headers=auth)
+    assert response.get_json()['changed'] == []
+
+    response = client.patch(f'/user/{public_id}', json={'password': 'changed'}, headers=auth)
+    assert response.get_json()['changed'] == ['password']